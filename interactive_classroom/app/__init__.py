@@ -2,8 +2,9 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 import os
+from .sharding import ShardedSession, configure_shard_binds, init_sharding
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession}) # Routes sharded tables when SHARD_DATABASE_URIS is set
 login_manager = LoginManager()
 login_manager.login_view = 'main.student_login' 
 login_manager.session_protection = "strong"
@@ -31,9 +32,31 @@ def create_app(config_class=None):
         'sqlite:///' + os.path.join(basedir, '..', 'classroom.db') # Place db outside app folder
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Seconds a cached live session state (active question, status) may be served before re-reading it
+    app.config['LIVE_STATE_TTL'] = float(os.environ.get('LIVE_STATE_TTL', 2.0))
+
+    # Optional per-classroom shards for ClassSession, StudentResponse and roster rows (see app/sharding.py)
+    shard_uris = os.environ.get('SHARD_DATABASE_URIS')
+    app.config['SHARD_DATABASE_URIS'] = [uri.strip() for uri in shard_uris.split(',') if uri.strip()] if shard_uris else []
+
+    # Server-side sessions: 'cookie' (default, signed cookie), 'memory', 'sqlite' or 'redis' (see app/session_store.py)
+    app.config['SESSION_STORE'] = os.environ.get('SESSION_STORE', 'cookie')
+    app.config['SESSION_STORE_URL'] = os.environ.get('SESSION_STORE_URL') # SQLite file path or redis:// URL
+
+    # Opt-in request recorder for benchmarks/replay.py; JSON lines file to append to
+    app.config['TRAFFIC_RECORD_PATH'] = os.environ.get('TRAFFIC_RECORD_PATH')
+
+    if config_class is not None:
+        app.config.from_object(config_class)
+
+    configure_shard_binds(app)
     db.init_app(app)
     login_manager.init_app(app)
 
+    # Registered first so the recorded duration covers the other request hooks too
+    from .traffic import init_traffic_recorder
+    init_traffic_recorder(app)
+
     # Import blueprints and models here to avoid circular imports
     # Models need to be defined before db.create_all() is called if using that pattern directly.
     # However, it's better to use Flask-Migrate or CLI commands for DB creation.
@@ -41,6 +64,16 @@ def create_app(config_class=None):
 
     from .routes import main_bp # Assuming routes are in main_bp
     app.register_blueprint(main_bp)
+
+    init_sharding(app)
+
+    # Short opaque session ids in the cookie instead of the signed session data, if configured
+    from .session_store import init_session_store
+    init_session_store(app)
+
+    # Fingerprint and precompress static files, cache headers and JSON compression
+    from .assets import init_assets
+    init_assets(app)
     
     # Example: For creating DB tables via a command, this would be in manage.py or run.py
     # with app.app_context():
@@ -0,0 +1,254 @@
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from .archive import unpack_responses
+from .models import ClassSession, Question, SessionArchive, StudentResponse, encode_answer
+from .sharding import for_each_shard
+from app import db # Import db instance
+
+# Cross-session analytics over all StudentResponse rows, hot and archived.
+# Responses are streamed as column chunks (NumPy arrays) and reduced with vectorized grouping,
+# so memory is bounded by the chunk size and the number of groups, not by the number of responses.
+# Import this module lazily (inside views/commands) to keep NumPy off the startup path.
+
+DEFAULT_CHUNK_SIZE = 50000
+ARCHIVE_BLOBS_PER_FETCH = 100 # Packed archive rows fetched from the database at a time
+MIN_PENDING_KEYS = 1 << 20 # GroupedCounts merges partial sums at most this often while the totals are small
+PERIOD_SECONDS = {'day': 86400, 'week': 7 * 86400}
+_WEEK_OFFSET_SECONDS = 3 * 86400 # 1970-01-01 was a Thursday; shift so weeks start on Monday
+_EPOCH = datetime(1970, 1, 1)
+_STUDENT_KEY_BITS = 32
+
+
+def _session_filter(presenter_id):
+    """Subquery of ClassSession ids presented by `presenter_id`, or None for all sessions."""
+    if presenter_id is None:
+        return None
+    return select(ClassSession.id).where(ClassSession.presenter_id == presenter_id)
+
+
+def iter_response_columns(presenter_id=None, student_id=None, chunk_size=DEFAULT_CHUNK_SIZE, with_timestamps=True):
+    """
+    Yields dicts of equally long NumPy arrays: class_session_id, student_id, question_id,
+    answer_code (int8, -1 if unknown) and, if with_timestamps, submitted_at (int64 seconds since epoch).
+    Covers hot responses first, then archived sessions one blob at a time, shard by shard.
+    """
+    for _ in for_each_shard():
+        yield from _iter_shard_response_columns(presenter_id, student_id, chunk_size, with_timestamps)
+
+
+def _iter_shard_response_columns(presenter_id, student_id, chunk_size, with_timestamps):
+    sessions = _session_filter(presenter_id)
+
+    # Timestamps are converted row by row by the driver, so they are only fetched when needed
+    timestamp_column = StudentResponse.submitted_at if with_timestamps else None
+    statement = select(StudentResponse.class_session_id, StudentResponse.student_id, StudentResponse.question_id,
+                       StudentResponse.chosen_answer_code, timestamp_column)
+    if sessions is not None:
+        statement = statement.where(StudentResponse.class_session_id.in_(sessions))
+    if student_id is not None:
+        statement = statement.where(StudentResponse.student_id == student_id)
+    result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        session_ids, student_ids, question_ids, answer_codes, submitted = zip(*rows)
+        chunk = {
+            'class_session_id': np.fromiter(session_ids, dtype=np.int64, count=len(rows)),
+            'student_id': np.fromiter(student_ids, dtype=np.int64, count=len(rows)),
+            'question_id': np.fromiter(question_ids, dtype=np.int64, count=len(rows)),
+            'answer_code': np.fromiter(answer_codes, dtype=np.int8, count=len(rows)),
+        }
+        if with_timestamps:
+            chunk['submitted_at'] = np.fromiter((((ts or _EPOCH) - _EPOCH).total_seconds() for ts in submitted),
+                                                dtype=np.float64, count=len(rows)).astype(np.int64)
+        yield chunk
+
+    archives = db.session.query(SessionArchive.class_session_id, SessionArchive.packed_columns)
+    if sessions is not None:
+        archives = archives.filter(SessionArchive.class_session_id.in_(sessions))
+    # Small archived sessions are collected into chunks of about chunk_size rows, so callers do
+    # the same number of passes per row as for hot responses
+    buffered, buffered_rows = [], 0
+    for class_session_id, packed_columns in archives.yield_per(ARCHIVE_BLOBS_PER_FETCH):
+        columns = unpack_responses(packed_columns)
+        student_ids = np.frombuffer(columns['student_id'], dtype=np.int32).astype(np.int64)
+        keep = slice(None) if student_id is None else student_ids == student_id
+        chunk = {
+            'class_session_id': np.full(len(student_ids), class_session_id, dtype=np.int64)[keep],
+            'student_id': student_ids[keep],
+            'question_id': np.frombuffer(columns['question_id'], dtype=np.int32).astype(np.int64)[keep],
+            'answer_code': np.frombuffer(columns['answer_code'], dtype=np.uint8).astype(np.int8)[keep],
+        }
+        if with_timestamps:
+            chunk['submitted_at'] = (np.frombuffer(columns['submitted_at_ms'], dtype=np.int64) // 1000)[keep]
+        buffered.append(chunk)
+        buffered_rows += len(chunk['student_id'])
+        if buffered_rows >= chunk_size:
+            yield _concatenate_chunks(buffered)
+            buffered, buffered_rows = [], 0
+    if buffered:
+        yield _concatenate_chunks(buffered)
+
+
+def _concatenate_chunks(chunks):
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def _correct_answer_vector():
+    """int8 array indexed by Question.id holding the correct answer code (-2 for unknown ids)."""
+    rows = db.session.query(Question.id, Question.correct_answer).all()
+    correct = np.full(max((question_id for question_id, _ in rows), default=0) + 1, -2, dtype=np.int8)
+    for question_id, letter in rows:
+        code = encode_answer(letter)
+        if code is not None:
+            correct[question_id] = code
+    return correct
+
+
+def _is_correct(chunk, correct):
+    question_ids = chunk['question_id']
+    known = question_ids < len(correct)
+    expected = np.full(len(question_ids), -2, dtype=np.int8)
+    expected[known] = correct[question_ids[known]]
+    return chunk['answer_code'] == expected
+
+
+class GroupedCounts:
+    """
+    Running per-key sums over chunks; memory grows with the number of distinct keys only.
+    Chunks are reduced on their own and merged into the totals only once the pending partial sums
+    outgrow the totals, so the merge work stays proportional to the rows added (amortized).
+    """
+
+    def __init__(self, num_values):
+        self._keys = np.empty(0, dtype=np.int64)
+        self._sums = np.empty((num_values, 0), dtype=np.float64)
+        self._pending = [] # (chunk keys, chunk sums) not merged yet
+        self._pending_keys = 0
+
+    def add(self, keys, *values):
+        chunk_keys, inverse = np.unique(keys, return_inverse=True)
+        chunk_sums = np.vstack([np.bincount(inverse, weights=v, minlength=len(chunk_keys)) for v in values])
+        self._pending.append((chunk_keys, chunk_sums))
+        self._pending_keys += len(chunk_keys)
+        if self._pending_keys > max(len(self._keys), MIN_PENDING_KEYS):
+            self._merge()
+
+    def _merge(self):
+        if not self._pending:
+            return
+        all_keys = np.concatenate([self._keys] + [chunk_keys for chunk_keys, _ in self._pending])
+        all_sums = np.hstack([self._sums] + [chunk_sums for _, chunk_sums in self._pending])
+        merged_keys, merged_inverse = np.unique(all_keys, return_inverse=True)
+        merged_sums = np.vstack([np.bincount(merged_inverse, weights=row, minlength=len(merged_keys)) for row in all_sums])
+        self._keys, self._sums = merged_keys, merged_sums
+        self._pending, self._pending_keys = [], 0
+
+    @property
+    def keys(self):
+        self._merge()
+        return self._keys
+
+    @property
+    def sums(self):
+        self._merge()
+        return self._sums
+
+    def lookup(self, keys):
+        """Sums for each key in `keys`; all keys must have been added."""
+        return self.sums[:, np.searchsorted(self.keys, keys)]
+
+
+def student_accuracy_history(period='week', presenter_id=None, student_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Accuracy per student per day/week across all sessions.
+    Returns a list of dicts ordered by student and period start.
+    """
+    period_seconds = PERIOD_SECONDS[period]
+    offset = _WEEK_OFFSET_SECONDS if period == 'week' else 0
+    correct = _correct_answer_vector()
+    groups = GroupedCounts(2)
+    for chunk in iter_response_columns(presenter_id, student_id, chunk_size):
+        if not len(chunk['student_id']):
+            continue
+        period_index = (chunk['submitted_at'] + offset) // period_seconds
+        keys = (chunk['student_id'] << _STUDENT_KEY_BITS) | period_index
+        groups.add(keys, np.ones(len(keys)), _is_correct(chunk, correct).astype(np.float64))
+
+    answered, answered_correctly = groups.sums
+    history = []
+    for key, total, num_correct in zip(groups.keys.tolist(), answered.tolist(), answered_correctly.tolist()):
+        period_index = key & ((1 << _STUDENT_KEY_BITS) - 1)
+        history.append({
+            'student_id': key >> _STUDENT_KEY_BITS,
+            'period_start': (_EPOCH + timedelta(seconds=period_index * period_seconds - offset)).date().isoformat(),
+            'answered': int(total),
+            'correct': int(num_correct),
+            'accuracy': num_correct / total,
+        })
+    return history
+
+
+def question_statistics(presenter_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Difficulty and discrimination per question across all sessions.
+    Difficulty is the proportion of correct answers. Discrimination is the point-biserial correlation
+    between answering the question correctly and the student's accuracy on the other questions of
+    the same session. Two passes: per (session, student) scores first, then per-question sums.
+    """
+    correct = _correct_answer_vector()
+
+    session_scores = GroupedCounts(2)
+    for chunk in iter_response_columns(presenter_id, chunk_size=chunk_size, with_timestamps=False):
+        if not len(chunk['student_id']):
+            continue
+        keys = (chunk['class_session_id'] << _STUDENT_KEY_BITS) | chunk['student_id']
+        session_scores.add(keys, np.ones(len(keys)), _is_correct(chunk, correct).astype(np.float64))
+
+    num_questions = len(correct)
+    # Per question: all answers, correct answers, and over answers with a rest score:
+    # count, correct count, sum of rest, sum of rest^2, sum of rest for correct answers
+    sums = np.zeros((7, num_questions))
+
+    for chunk in iter_response_columns(presenter_id, chunk_size=chunk_size, with_timestamps=False):
+        known = chunk['question_id'] < num_questions
+        if not known.any():
+            continue
+        chunk = {name: column[known] for name, column in chunk.items()}
+        question_ids = chunk['question_id']
+        is_correct = _is_correct(chunk, correct).astype(np.float64)
+
+        # Rest score: accuracy on the student's other answers in the same session
+        keys = (chunk['class_session_id'] << _STUDENT_KEY_BITS) | chunk['student_id']
+        session_answered, session_correct = session_scores.lookup(keys)
+        has_rest = (session_answered > 1).astype(np.float64)
+        rest = np.divide(session_correct - is_correct, session_answered - 1,
+                         out=np.zeros(len(keys)), where=session_answered > 1)
+
+        for row, weights in enumerate((np.ones(len(keys)), is_correct, has_rest, is_correct * has_rest,
+                                       rest * has_rest, rest * rest * has_rest, rest * is_correct * has_rest)):
+            sums[row] += np.bincount(question_ids, weights=weights, minlength=num_questions)
+
+    answered, answered_correctly, n, n_correct, sum_rest, sum_rest_sq, sum_rest_correct = sums
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difficulty = answered_correctly / answered
+        # Pearson correlation between 0/1 correctness and the rest score
+        mean_correct = n_correct / n
+        mean_rest = sum_rest / n
+        covariance = sum_rest_correct / n - mean_rest * mean_correct
+        spread = np.sqrt(np.maximum(sum_rest_sq / n - mean_rest ** 2, 0) * mean_correct * (1 - mean_correct))
+        discrimination = covariance / spread
+
+    ref_ids = dict(db.session.query(Question.id, Question.question_ref_id).all())
+    statistics = []
+    for question_id in np.flatnonzero(answered).tolist():
+        statistics.append({
+            'question_db_id': question_id,
+            'question_ref_id': ref_ids.get(question_id),
+            'answered': int(answered[question_id]),
+            'correct': int(answered_correctly[question_id]),
+            'difficulty': float(difficulty[question_id]),
+            'discrimination': float(discrimination[question_id]) if np.isfinite(discrimination[question_id]) else None,
+        })
+    return statistics
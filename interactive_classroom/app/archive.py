@@ -0,0 +1,163 @@
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text
+from .models import ANSWER_LETTERS, ClassSession, SessionArchive, StudentResponse
+from .sharding import for_each_shard
+from app import db # Import db instance
+
+# Cold storage for ended sessions.
+# The responses of an archived ClassSession are packed column-wise (student id, question id,
+# answer code, timestamp) into a single zlib blob in SessionArchive, and removed from student_response.
+
+ARCHIVE_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<I') # Number of packed responses
+_EPOCH = datetime(1970, 1, 1)
+
+ArchiveReport = namedtuple('ArchiveReport', ['sessions', 'responses', 'packed_bytes', 'reclaimed_bytes'])
+
+
+def _little_endian_bytes(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _array_from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def pack_responses(responses):
+    """
+    Packs StudentResponse-like rows into the compact archive format.
+    Raises ValueError for answers that cannot be encoded.
+    """
+    student_ids = array('i')
+    question_ids = array('i')
+    answer_codes = array('B')
+    timestamps_ms = array('q')
+    for response in responses:
+        code = response.chosen_answer_code
+        if code is None or not 0 <= code < len(ANSWER_LETTERS):
+            raise ValueError(f"Cannot archive answer code {code!r} (response of user {response.student_id}, Q_DB_ID {response.question_id})")
+        student_ids.append(response.student_id)
+        question_ids.append(response.question_id)
+        answer_codes.append(code)
+        submitted_at = response.submitted_at or _EPOCH
+        timestamps_ms.append(int((submitted_at - _EPOCH).total_seconds() * 1000))
+
+    payload = b''.join([
+        _HEADER.pack(len(answer_codes)),
+        _little_endian_bytes(student_ids),
+        _little_endian_bytes(question_ids),
+        answer_codes.tobytes(),
+        _little_endian_bytes(timestamps_ms),
+    ])
+    return zlib.compress(payload, 9)
+
+
+def unpack_responses(packed_columns):
+    """
+    Reverses pack_responses. Returns a dict of arrays keyed by
+    'student_id', 'question_id', 'answer_code' and 'submitted_at_ms'.
+    """
+    payload = zlib.decompress(packed_columns)
+    (count,) = _HEADER.unpack_from(payload)
+    offset = _HEADER.size
+    columns = {}
+    for name, typecode in (('student_id', 'i'), ('question_id', 'i'), ('answer_code', 'B'), ('submitted_at_ms', 'q')):
+        size = count * array(typecode).itemsize
+        columns[name] = _array_from_bytes(typecode, payload[offset:offset + size])
+        offset += size
+    return columns
+
+
+def _database_used_bytes():
+    """Bytes in use in the database holding student_response (SQLite only), or None if not measurable."""
+    bind_arguments = {'mapper': StudentResponse} # The current shard when sessions are sharded
+    if db.session.get_bind(**bind_arguments).dialect.name != 'sqlite':
+        return None
+    page_size, page_count, freelist_count = (
+        db.session.execute(text(f'PRAGMA {pragma}'), bind_arguments=bind_arguments).scalar()
+        for pragma in ('page_size', 'page_count', 'freelist_count'))
+    return (page_count - freelist_count) * page_size
+
+
+def archive_ended_sessions(older_than_days, dry_run=False):
+    """
+    Moves the responses of ended ClassSessions created more than `older_than_days` days ago
+    into SessionArchive, in every shard. Each session is archived in its own transaction.
+    Returns an ArchiveReport; reclaimed_bytes is None when the database cannot report it.
+    """
+    totals = [0, 0, 0, 0]
+    measurable = True
+    for _ in for_each_shard():
+        report = _archive_ended_sessions_in_shard(older_than_days, dry_run)
+        for i, value in enumerate(report[:3]):
+            totals[i] += value
+        if report.reclaimed_bytes is None:
+            measurable = False
+        else:
+            totals[3] += report.reclaimed_bytes
+    return ArchiveReport(totals[0], totals[1], totals[2], totals[3] if measurable and not dry_run else None)
+
+
+def _archive_ended_sessions_in_shard(older_than_days, dry_run):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    candidates = ClassSession.query.filter(
+        ClassSession.is_active.is_(False),
+        ClassSession.created_at < cutoff,
+        ~ClassSession.id.in_(db.session.query(SessionArchive.class_session_id)),
+    ).order_by(ClassSession.id).all()
+
+    used_bytes_before = _database_used_bytes()
+    sessions_archived = 0
+    responses_archived = 0
+    packed_bytes = 0
+
+    for class_session in candidates:
+        responses = StudentResponse.query.filter_by(class_session_id=class_session.id).order_by(StudentResponse.id).all()
+        try:
+            packed_columns = pack_responses(responses)
+        except ValueError as e:
+            current_app.logger.warning(f"Skipping archival of ClassSession {class_session.id}: {e}")
+            continue
+
+        sessions_archived += 1
+        responses_archived += len(responses)
+        packed_bytes += len(packed_columns)
+        if dry_run:
+            continue
+
+        db.session.add(SessionArchive(
+            class_session_id=class_session.id,
+            format_version=ARCHIVE_FORMAT_VERSION,
+            response_count=len(responses),
+            packed_columns=packed_columns,
+        ))
+        StudentResponse.query.filter_by(class_session_id=class_session.id).delete(synchronize_session=False)
+        try:
+            db.session.commit()
+            current_app.logger.info(f"Archived ClassSession {class_session.id}: {len(responses)} responses packed into {len(packed_columns)} bytes.")
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error archiving ClassSession {class_session.id}: {e}")
+            sessions_archived -= 1
+            responses_archived -= len(responses)
+            packed_bytes -= len(packed_columns)
+
+    reclaimed_bytes = None
+    if not dry_run and used_bytes_before is not None:
+        reclaimed_bytes = used_bytes_before - _database_used_bytes()
+
+    return ArchiveReport(sessions_archived, responses_archived, packed_bytes, reclaimed_bytes)
@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from collections import namedtuple
+from flask import abort, current_app, request, url_for
+from flask.sessions import SessionInterface
+
+# Fingerprinted, precompressed static assets.
+# At startup every file under static/ (except generated QR codes) is hashed and compressed in memory.
+# Templates link to /assets/<name>.<hash>.<ext> via asset_url(), and those URLs are served with
+# immutable cache headers, so student devices fetch each version of a file once. They are served without
+# a session, so responses carry no Set-Cookie or Vary: Cookie and shared proxies can cache them too.
+
+ASSET_URL_PREFIX = '/assets/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_MIMETYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+QR_CODE_DIR = 'qr_codes' # Generated at runtime; each file name is unique and never rewritten
+
+# Student JSON endpoints whose responses are gzip-compressed when the client accepts it
+COMPRESSED_JSON_ENDPOINTS = ('main.get_current_question', 'main.student_submit_answer')
+DEFAULT_JSON_COMPRESS_MIN_SIZE = 200 # Bytes; smaller bodies do not shrink enough to be worth it
+
+Asset = namedtuple('Asset', ['filename', 'fingerprint', 'mimetype', 'encodings']) # encodings: {'identity'|'gzip'|'br': bytes}
+
+
+def _fingerprinted_name(filename, fingerprint):
+    root, extension = os.path.splitext(filename)
+    return f"{root}.{fingerprint}{extension}"
+
+
+def build_asset_manifest(static_folder):
+    """Hashes and precompresses static files. Returns {fingerprinted name: Asset}."""
+    try:
+        import brotli # Optional; gzip is always available
+    except ImportError:
+        brotli = None
+
+    manifest = {}
+    for directory, subdirectories, files in os.walk(static_folder):
+        if os.path.relpath(directory, static_folder) == '.' and QR_CODE_DIR in subdirectories:
+            subdirectories.remove(QR_CODE_DIR)
+        for name in files:
+            path = os.path.join(directory, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            fingerprint = hashlib.sha256(data).hexdigest()[:12]
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            encodings = {'identity': data}
+            if mimetype.startswith(COMPRESSIBLE_MIMETYPES):
+                encodings['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+                if brotli is not None:
+                    encodings['br'] = brotli.compress(data)
+            manifest[_fingerprinted_name(filename, fingerprint)] = Asset(filename, fingerprint, mimetype, encodings)
+    return manifest
+
+
+def asset_url(filename):
+    """Fingerprinted URL for a static file; falls back to the plain static URL in debug mode or for unknown files."""
+    fingerprinted = current_app.extensions['asset_names'].get(filename)
+    if fingerprinted is None or current_app.debug:
+        return url_for('static', filename=filename)
+    return url_for('fingerprinted_asset', filename=fingerprinted)
+
+
+def _preferred_encoding(asset):
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.encodings and request.accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+
+def serve_fingerprinted_asset(filename):
+    asset = current_app.extensions['asset_manifest'].get(filename)
+    if asset is None:
+        abort(404)
+
+    encoding = _preferred_encoding(asset)
+    # Each encoding is a different representation, so each gets its own entity tag
+    entity_tag = asset.fingerprint if encoding == 'identity' else f'{asset.fingerprint}-{encoding}'
+    if request.if_none_match.contains_weak(entity_tag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(asset.encodings[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.set_etag(entity_tag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class AssetSessionInterface(SessionInterface):
+    """
+    Wraps the app's session interface and opens no session for fingerprinted assets. Flask then skips
+    save_session, which would otherwise add Vary: Cookie once Flask-Login reads the session.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name) # e.g. the server-side store's stats
+
+    def open_session(self, app, request):
+        if request.path.startswith(ASSET_URL_PREFIX):
+            return self.make_null_session(app)
+        return self.wrapped.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.wrapped.save_session(app, session, response)
+
+
+def _cache_and_compress(response):
+    if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith(f'{QR_CODE_DIR}/'):
+        if response.status_code == 200:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    if request.endpoint in COMPRESSED_JSON_ENDPOINTS and response.mimetype == 'application/json' \
+            and not response.direct_passthrough and 'Content-Encoding' not in response.headers:
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        min_size = current_app.config.get('JSON_COMPRESS_MIN_SIZE', DEFAULT_JSON_COMPRESS_MIN_SIZE)
+        if len(body) >= min_size and request.accept_encodings['gzip']:
+            response.set_data(gzip.compress(body, compresslevel=5, mtime=0))
+            response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_assets(app):
+    manifest = build_asset_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+    app.extensions['asset_names'] = {asset.filename: name for name, asset in manifest.items()}
+    app.add_url_rule(f'{ASSET_URL_PREFIX}<path:filename>', 'fingerprinted_asset', serve_fingerprinted_asset)
+    app.session_interface = AssetSessionInterface(app.session_interface)
+    app.add_template_global(asset_url)
+    app.after_request(_cache_and_compress)
+    app.logger.debug(f"Fingerprinted {len(manifest)} static asset(s).")
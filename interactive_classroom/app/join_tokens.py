@@ -0,0 +1,74 @@
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from .models import ClassSession
+from .sharding import for_each_shard
+from app import db # Import db instance
+
+# Signed, expiring join tokens for the QR code URL.
+# A token carries the ClassSession id and code, so student_login can admit a student without a
+# ClassSession lookup. Ended sessions are tracked in a small revoked set that teacher_end_session
+# adds to; each process also reloads it from the database every REVOKED_SESSIONS_REFRESH seconds.
+
+JOIN_TOKEN_SALT = 'class-session-join'
+DEFAULT_JOIN_TOKEN_MAX_AGE = 4 * 60 * 60 # Seconds
+DEFAULT_REVOKED_SESSIONS_REFRESH = 5.0 # Seconds
+
+_revoked_session_ids = set()
+_revoked_loaded_at = None
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=JOIN_TOKEN_SALT)
+
+
+def _max_age():
+    return current_app.config.get('JOIN_TOKEN_MAX_AGE', DEFAULT_JOIN_TOKEN_MAX_AGE)
+
+
+def make_join_token(class_session):
+    """Returns a URL-safe token for joining `class_session`. The session must already have an id."""
+    return _serializer().dumps([class_session.id, class_session.session_code])
+
+
+def _reload_revoked_sessions():
+    """Loads ended sessions young enough to still have unexpired tokens."""
+    global _revoked_loaded_at
+    oldest_valid = datetime.utcnow() - timedelta(seconds=_max_age())
+    ended_ids = []
+    for _ in for_each_shard():
+        ended_ids.extend(db.session.query(ClassSession.id).filter(
+            ClassSession.is_active.is_(False),
+            ClassSession.created_at >= oldest_valid,
+        ).all())
+    _revoked_session_ids.clear()
+    _revoked_session_ids.update(class_session_id for (class_session_id,) in ended_ids)
+    _revoked_loaded_at = time.monotonic()
+
+
+def is_session_revoked(class_session_id):
+    refresh = current_app.config.get('REVOKED_SESSIONS_REFRESH', DEFAULT_REVOKED_SESSIONS_REFRESH)
+    if _revoked_loaded_at is None or time.monotonic() - _revoked_loaded_at >= refresh:
+        _reload_revoked_sessions()
+    return class_session_id in _revoked_session_ids
+
+
+def revoke_session(class_session_id):
+    """Called when a session ends so its join tokens stop working immediately in this process."""
+    _revoked_session_ids.add(class_session_id)
+
+
+def read_join_token(token):
+    """
+    Validates a join token without touching the ClassSession table.
+    Returns (class_session_id, session_code), or None if the token is forged, expired or revoked.
+    """
+    try:
+        class_session_id, session_code = _serializer().loads(token, max_age=_max_age())
+    except (BadSignature, ValueError, TypeError) as e: # SignatureExpired is a BadSignature
+        current_app.logger.warning(f"Rejected join token: {e}")
+        return None
+    if is_session_revoked(class_session_id):
+        return None
+    return class_session_id, session_code
@@ -0,0 +1,164 @@
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from flask import current_app
+from sqlalchemy import func
+from .models import ClassSession, Question, StudentResponse, decode_answer, session_student_association
+from app import db # Import db instance
+
+# Per-process cache of the small, hot part of a ClassSession that student endpoints check on every request.
+# Teacher routes write through it after committing; entries also expire after LIVE_STATE_TTL seconds so
+# that other worker processes pick up changes made elsewhere. Both caches in this module keep at most
+# LIVE_STATE_MAX_SESSIONS sessions, dropping the least recently used, and forget a session once it ends.
+
+LiveSessionState = namedtuple('LiveSessionState', ['class_session_id', 'presenter_id', 'is_active', 'active_question_db_id', 'active_question_status', 'active_question_ref_id'])
+
+DEFAULT_LIVE_STATE_TTL = 2.0 # Seconds
+DEFAULT_LIVE_STATE_MAX_SESSIONS = 1000
+
+_live_states = OrderedDict() # class_session_id -> (loaded_at, LiveSessionState or None), least recently used first
+_live_states_lock = threading.Lock()
+
+
+def _max_sessions():
+    return current_app.config.get('LIVE_STATE_MAX_SESSIONS', DEFAULT_LIVE_STATE_MAX_SESSIONS)
+
+
+def _remember(entries, class_session_id, entry):
+    """Stores an entry as the most recently used one and drops the least recently used beyond the limit."""
+    entries[class_session_id] = entry
+    entries.move_to_end(class_session_id)
+    while len(entries) > _max_sessions():
+        entries.popitem(last=False)
+
+
+def _load_live_state(class_session_id):
+    row = db.session.query(
+        ClassSession.id,
+        ClassSession.presenter_id,
+        ClassSession.is_active,
+        ClassSession.active_question_db_id,
+        ClassSession.active_question_status,
+    ).filter(ClassSession.id == class_session_id).first()
+    if row is None:
+        return None
+    # Separate query: questions live in the catalog database when sessions are sharded
+    active_question_ref_id = None
+    if row.active_question_db_id:
+        active_question_ref_id = db.session.query(Question.question_ref_id).filter(Question.id == row.active_question_db_id).scalar()
+    return LiveSessionState(*row, active_question_ref_id)
+
+
+def get_live_state(class_session_id, force=False):
+    """
+    Returns the LiveSessionState of a ClassSession, or None if it does not exist.
+    Served from the cache while the entry is fresh, otherwise loaded with a single query.
+    With force=True the state is always reloaded, for callers about to reject a request because of it.
+    """
+    ttl = current_app.config.get('LIVE_STATE_TTL', DEFAULT_LIVE_STATE_TTL)
+    now = time.monotonic()
+    with _live_states_lock:
+        cached = _live_states.get(class_session_id)
+        if not force and cached is not None and now - cached[0] < ttl:
+            _live_states.move_to_end(class_session_id)
+            return cached[1]
+
+    state = _load_live_state(class_session_id)
+    with _live_states_lock:
+        _remember(_live_states, class_session_id, (now, state))
+    return state
+
+
+def refresh_live_state(class_session):
+    """Writes the committed state of a ClassSession through to the cache."""
+    active_question_ref_id = None
+    if class_session.active_question_db_id:
+        active_question = Question.query.get(class_session.active_question_db_id)
+        active_question_ref_id = active_question.question_ref_id if active_question else None
+    state = LiveSessionState(
+        class_session.id,
+        class_session.presenter_id,
+        class_session.is_active,
+        class_session.active_question_db_id,
+        class_session.active_question_status,
+        active_question_ref_id,
+    )
+    with _live_states_lock:
+        _remember(_live_states, class_session.id, (time.monotonic(), state))
+
+
+def forget_session(class_session_id):
+    """Drops an ended session from this process's caches. Later requests for it load the ended state once more."""
+    with _live_states_lock:
+        _live_states.pop(class_session_id, None)
+    with _tracked_snapshots_lock:
+        _tracked_snapshots.pop(class_session_id, None)
+
+
+def clear_live_states():
+    with _live_states_lock:
+        _live_states.clear()
+
+
+# --- Change tracking for the teacher management page ---
+# Every poll compares a cheap snapshot of the session (none of its queries depend on the size of
+# the question bank) with the last one seen in this process and bumps a per-session version for
+# each field that changed. Clients send back the version and process epoch they last saw and get
+# only the fields changed since; a different epoch (restart, other worker) gets the full snapshot.
+# Versions come from one counter for the whole process, so a session whose snapshot was dropped
+# (least recently used, or ended) never hands out a version a client already saw.
+
+CHANGES_EPOCH = uuid.uuid4().hex[:8]
+
+_tracked_snapshots = OrderedDict() # class_session_id -> {'version': int, 'fields': dict, 'field_versions': dict}
+_tracked_snapshots_lock = threading.Lock()
+_versions = itertools.count(1)
+
+
+def _session_snapshot(live_state):
+    num_joined_students = db.session.query(func.count()).select_from(session_student_association).filter(
+        session_student_association.c.class_session_id == live_state.class_session_id).scalar()
+
+    histogram = {}
+    if live_state.active_question_db_id:
+        counts = db.session.query(StudentResponse.chosen_answer_code, func.count()).filter_by(
+            class_session_id=live_state.class_session_id,
+            question_id=live_state.active_question_db_id,
+        ).group_by(StudentResponse.chosen_answer_code).all()
+        histogram = {decode_answer(code) or '?': count for code, count in counts} # Letters for the page
+
+    return {
+        'is_active': live_state.is_active,
+        'active_question_db_id': live_state.active_question_db_id,
+        'active_question_ref_id': live_state.active_question_ref_id,
+        'active_question_status': live_state.active_question_status or 'none',
+        'num_joined_students': num_joined_students,
+        'num_responses_for_current_question': sum(histogram.values()),
+        'answer_histogram': histogram,
+    }
+
+
+def session_changes(live_state, since_version=None, epoch=None):
+    """
+    Returns (version, changed_fields, is_full) for a session.
+    changed_fields holds every snapshot field changed after `since_version`, or all fields
+    if the client has no version yet or its version came from another process epoch.
+    """
+    snapshot = _session_snapshot(live_state)
+    with _tracked_snapshots_lock:
+        tracked = _tracked_snapshots.get(live_state.class_session_id) or {'version': 0, 'fields': {}, 'field_versions': {}}
+        _remember(_tracked_snapshots, live_state.class_session_id, tracked)
+        changed = [field for field, value in snapshot.items() if field not in tracked['fields'] or tracked['fields'][field] != value]
+        if changed:
+            tracked['version'] = next(_versions)
+            for field in changed:
+                tracked['fields'][field] = snapshot[field]
+                tracked['field_versions'][field] = tracked['version']
+        version = tracked['version']
+        field_versions = dict(tracked['field_versions'])
+
+    if since_version is None or epoch != CHANGES_EPOCH or since_version > version:
+        return version, snapshot, True
+    return version, {field: snapshot[field] for field, changed_at in field_versions.items() if changed_at > since_version}, False
@@ -3,12 +3,38 @@ from flask_login import UserMixin
 from datetime import datetime
 from sqlalchemy import UniqueConstraint
 
+# Answers are stored and processed as small integer codes: the index of the letter in ANSWER_LETTERS.
+# Letters only appear at the edges (submitted JSON, templates, Question.correct_answer).
+ANSWER_LETTERS = 'ABCD'
+NO_ANSWER = -1 # Code for "not answered" in result matrices and unknown answers in upgraded rows
+
+def encode_answer(letter):
+    """'A'..'D' -> 0..3; None for anything else."""
+    if isinstance(letter, str) and len(letter) == 1:
+        code = ANSWER_LETTERS.find(letter.upper())
+        if code >= 0:
+            return code
+    return None
+
+def decode_answer(code):
+    """0..3 -> 'A'..'D'; None for NO_ANSWER or unknown codes."""
+    if code is not None and 0 <= code < len(ANSWER_LETTERS):
+        return ANSWER_LETTERS[code]
+    return None
+
 # Association Table for Many-to-Many relationship between ClassSession and User (students)
 session_student_association = db.Table('session_student_association',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
     db.Column('class_session_id', db.Integer, db.ForeignKey('class_session.id'), primary_key=True)
 )
 
+# Next ClassSession id of each shard and the shard layout it was created with, see app/sharding.py
+# (only used when sessions are sharded)
+shard_id_counter = db.Table('shard_id_counter',
+    db.Column('name', db.String(50), primary_key=True),
+    db.Column('next_value', db.Integer, nullable=False)
+)
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
@@ -56,6 +82,22 @@ class ClassSession(db.Model):
     def __repr__(self):
         return f'<ClassSession {self.session_code} (ID: {self.id}) Active: {self.is_active}>'
 
+    # Roster helpers that only touch session_student_association, so they also work when
+    # sessions are sharded away from the User table (students_in_session joins both).
+    def student_ids(self):
+        return [user_id for (user_id,) in db.session.query(session_student_association.c.user_id).filter(
+            session_student_association.c.class_session_id == self.id)]
+
+    def count_students(self):
+        return db.session.query(db.func.count()).select_from(session_student_association).filter(
+            session_student_association.c.class_session_id == self.id).scalar()
+
+    def has_student(self, user_id):
+        return db.session.query(session_student_association).filter_by(user_id=user_id, class_session_id=self.id).first() is not None
+
+    def add_student(self, user_id):
+        db.session.execute(session_student_association.insert().values(user_id=user_id, class_session_id=self.id))
+
 class Question(db.Model):
     __tablename__ = 'question'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -76,6 +118,10 @@ class Question(db.Model):
     def __repr__(self):
         return f'<Question {self.question_ref_id} (ID: {self.id})>'
 
+    @property
+    def correct_answer_code(self):
+        return encode_answer(self.correct_answer)
+
     def get_options_dict(self):
         options = {}
         if self.option_a: options['A'] = self.option_a
@@ -90,7 +136,7 @@ class StudentResponse(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     class_session_id = db.Column(db.Integer, db.ForeignKey('class_session.id'), nullable=False)
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False) # This is Question.id (PK)
-    chosen_answer = db.Column(db.String(1), nullable=False) # 'A', 'B', 'C', 'D'
+    chosen_answer_code = db.Column(db.SmallInteger, nullable=False) # 0-3 for 'A'-'D', see encode_answer
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships (backrefs are defined in User, ClassSession, Question)
@@ -102,9 +148,32 @@ class StudentResponse(db.Model):
     # Unique constraint: a student can only answer a specific question once in a session
     __table_args__ = (UniqueConstraint('student_id', 'class_session_id', 'question_id', name='_student_session_question_uc'),)
 
+    # Letter view of chosen_answer_code for display and the ORM constructor; queries use the code column
+    @property
+    def chosen_answer(self):
+        return decode_answer(self.chosen_answer_code)
+
+    @chosen_answer.setter
+    def chosen_answer(self, letter):
+        self.chosen_answer_code = encode_answer(letter)
+
     def __repr__(self):
         return f'<StudentResponse UserID:{self.student_id} SessionID:{self.class_session_id} QID:{self.question_id} Ans:{self.chosen_answer}>'
 
+class SessionArchive(db.Model):
+    __tablename__ = 'session_archive'
+    # One packed blob per archived ClassSession; its StudentResponse rows are removed from the hot table.
+    class_session_id = db.Column(db.Integer, db.ForeignKey('class_session.id'), primary_key=True)
+    format_version = db.Column(db.SmallInteger, nullable=False, default=1)
+    response_count = db.Column(db.Integer, nullable=False)
+    packed_columns = db.Column(db.LargeBinary, nullable=False) # zlib-compressed column arrays, see app/archive.py
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    class_session = db.relationship('ClassSession', backref=db.backref('archive', uselist=False))
+
+    def __repr__(self):
+        return f'<SessionArchive SessionID:{self.class_session_id} Responses:{self.response_count} Bytes:{len(self.packed_columns or b"")}>'
+
 # Data for seeding questions (can be moved to a dedicated seed script or config)
 # This is here just for reference during refactoring, will be moved for seeding.
 initial_quiz_questions_data = [
@@ -114,6 +183,31 @@ initial_quiz_questions_data = [
     {'question_ref_id': 'q4', 'text': 'What is the largest ocean on Earth?', 'options': {'A': 'Atlantic', 'B': 'Indian', 'C': 'Arctic', 'D': 'Pacific'}, 'correct_answer': 'D'}
 ]
 
+def upgrade_answer_codes():
+    """
+    Converts an existing student_response table from the old chosen_answer letter column to
+    chosen_answer_code, in every shard. Letters other than A-D become NO_ANSWER.
+    Returns the number of tables upgraded.
+    """
+    from sqlalchemy import inspect, text
+    from app.sharding import for_each_shard
+    upgraded = 0
+    for _ in for_each_shard():
+        bind = db.session.get_bind(mapper=StudentResponse)
+        columns = {column['name'] for column in inspect(bind).get_columns('student_response')}
+        if 'chosen_answer_code' in columns or 'chosen_answer' not in columns:
+            continue
+        cases = ' '.join(f"WHEN '{letter}' THEN {code}" for code, letter in enumerate(ANSWER_LETTERS))
+        for statement in (
+            f'ALTER TABLE student_response ADD COLUMN chosen_answer_code SMALLINT NOT NULL DEFAULT {NO_ANSWER}',
+            f'UPDATE student_response SET chosen_answer_code = CASE UPPER(chosen_answer) {cases} ELSE {NO_ANSWER} END',
+            'ALTER TABLE student_response DROP COLUMN chosen_answer',
+        ):
+            db.session.execute(text(statement), bind_arguments={'mapper': StudentResponse})
+        db.session.commit()
+        upgraded += 1
+    return upgraded
+
 def seed_questions():
     from app import db # Local import to ensure app context
     if Question.query.first() is None: # Check if questions already exist
@@ -0,0 +1,108 @@
+import numpy as np
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select
+from .archive import unpack_responses
+from .models import NO_ANSWER, Question, SessionArchive, StudentResponse, User, encode_answer
+from app import db # Import db instance
+
+# Session results as arrays instead of nested per-answer dicts.
+# A student x question int8 matrix of answer codes (NO_ANSWER where a student did not answer) and
+# a vector of correct answer codes are all that is kept; correctness and scores are computed with
+# NumPy, and question text, letters and names are only looked up while the template renders.
+
+DEFAULT_CHUNK_SIZE = 20000 # Response rows converted to arrays at a time
+
+# One row of the results table. answer_codes and correct_flags are views into the session matrices.
+StudentResult = namedtuple('StudentResult', ['student_id', 'name', 'email', 'score', 'answer_codes', 'correct_flags'])
+
+
+class SessionResults:
+
+    def __init__(self, student_ids, questions, answers):
+        self.student_ids = student_ids # int64, sorted; matrix rows
+        self.questions = questions # Question objects in column order
+        self.answers = answers # int8 [student, question]
+        self.correct = np.array([_code_or_unknown(question.correct_answer) for question in questions], dtype=np.int8)
+        self.is_correct = answers == self.correct # Broadcasts the correct vector over every student
+        self.scores = self.is_correct.sum(axis=1)
+
+    def ranking(self):
+        """Row indexes ordered by score, highest first; ties keep student id order."""
+        return np.argsort(-self.scores, kind='stable')
+
+    def rows(self, users):
+        """StudentResult rows in ranking order. `users` maps student id to User."""
+        rows = []
+        for index in self.ranking().tolist():
+            user = users.get(int(self.student_ids[index]))
+            if user is None:
+                continue
+            rows.append(StudentResult(user.id, user.name, user.email, int(self.scores[index]),
+                                      self.answers[index], self.is_correct[index]))
+        return rows
+
+
+def _code_or_unknown(letter):
+    code = encode_answer(letter)
+    return -2 if code is None else code # Never equal to a stored answer or NO_ANSWER
+
+
+def _response_chunks(class_session, chunk_size):
+    """
+    Yields (student_ids, question_ids, answer_codes) arrays of one session. This is the reader for a
+    single session's responses, hot or archived; analytics.iter_response_columns covers many sessions.
+    """
+    archive = db.session.get(SessionArchive, class_session.id)
+    if archive is not None:
+        columns = unpack_responses(archive.packed_columns)
+        yield (np.frombuffer(columns['student_id'], dtype=np.int32),
+               np.frombuffer(columns['question_id'], dtype=np.int32),
+               np.frombuffer(columns['answer_code'], dtype=np.uint8).astype(np.int8))
+        return
+
+    statement = select(StudentResponse.student_id, StudentResponse.question_id, StudentResponse.chosen_answer_code) \
+        .where(StudentResponse.class_session_id == class_session.id)
+    for rows in db.session.execute(statement.execution_options(yield_per=chunk_size)).partitions():
+        student_ids, question_ids, answer_codes = zip(*rows)
+        yield (np.fromiter(student_ids, dtype=np.int64, count=len(rows)),
+               np.fromiter(question_ids, dtype=np.int64, count=len(rows)),
+               np.fromiter(answer_codes, dtype=np.int8, count=len(rows)))
+
+
+def _positions(sorted_ids, ids):
+    """Index of each id in sorted_ids, and a mask of the ids that were found."""
+    positions = np.searchsorted(sorted_ids, ids)
+    found = positions < len(sorted_ids)
+    found[found] = sorted_ids[positions[found]] == ids[found]
+    return positions, found
+
+
+def build_session_results(class_session, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Builds the SessionResults of a ClassSession for the students on its roster and all questions.
+    Responses are read `chunk_size` rows at a time straight into the answer matrix.
+    """
+    student_ids = np.array(sorted(class_session.student_ids()), dtype=np.int64)
+    questions = Question.query.order_by(Question.id).all()
+    question_ids = np.array([question.id for question in questions], dtype=np.int64)
+
+    answers = np.full((len(student_ids), len(questions)), NO_ANSWER, dtype=np.int8)
+    skipped = 0
+    for response_students, response_questions, response_codes in _response_chunks(class_session, chunk_size):
+        rows, known_student = _positions(student_ids, response_students)
+        columns, known_question = _positions(question_ids, response_questions)
+        known = known_student & known_question
+        skipped += int((~known).sum())
+        answers[rows[known], columns[known]] = response_codes[known]
+    if skipped:
+        current_app.logger.warning(
+            f"Skipped {skipped} response(s) of ClassSession {class_session.id} from students "
+            f"not on the roster or for unknown questions.")
+    return SessionResults(student_ids, questions, answers)
+
+
+def session_result_rows(results):
+    """Joins names and emails to the ranked results, with one User query."""
+    users = {user.id: user for user in User.query.filter(User.id.in_(results.student_ids.tolist()))}
+    return results.rows(users)
@@ -1,8 +1,11 @@
 from flask import jsonify, render_template, Blueprint, request, redirect, url_for, session, current_app, flash, abort
 from flask_login import login_user, logout_user, login_required, current_user
-from .services import generate_session_qr, get_or_create_user, get_google_auth_flow, process_google_callback 
+from .services import generate_session_qr, get_or_create_user, get_google_auth_flow, process_google_callback, insert_student_response
 # Removed User from models import here as it's used via db.User now. Models are imported in __init__
-from .models import ClassSession, Question, StudentResponse, User # Import necessary DB models
+from .models import ANSWER_LETTERS, ClassSession, Question, StudentResponse, decode_answer, encode_answer # Import necessary DB models
+from .live_state import CHANGES_EPOCH, forget_session, get_live_state, refresh_live_state, session_changes
+from .join_tokens import make_join_token, read_join_token, revoke_session
+from .sharding import allocate_class_session_id
 from app import db # Import the SQLAlchemy db instance
 from werkzeug.exceptions import BadRequest
 from datetime import datetime
@@ -28,32 +31,56 @@ def teacher_start_session():
     and displays it to the teacher.
     """
     session_code_uuid = str(uuid.uuid4())
-    base_url = request.host_url.rstrip('/')
-    # The QR code URL should point to the student login page with the session_code
-    qr_code_path, _ = generate_session_qr(f"{base_url}{url_for('main.student_login')}?session_code={session_code_uuid}")
-
-    new_class_session = ClassSession(
-        session_code=session_code_uuid,
-        qr_code_url=qr_code_path, # Store the path to the QR image
-        presenter_id=current_user.id,
-        is_active=True,
-        # active_question_id and active_question_status are nullable, default to None/Null
-    )
-    db.session.add(new_class_session)
     try:
+        new_class_session = ClassSession(
+            id=allocate_class_session_id(session_code_uuid), # None unless sessions are sharded
+            session_code=session_code_uuid,
+            presenter_id=current_user.id,
+            is_active=True,
+            # active_question_id and active_question_status are nullable, default to None/Null
+        )
+        db.session.add(new_class_session)
+        # Committed before the QR code is rendered, so the write lock (the whole database on SQLite)
+        # is not held while the image is built and saved and student submits are not held up
         db.session.commit()
         current_app.logger.info(f"New ClassSession created with ID: {new_class_session.id} and code: {new_class_session.session_code} by presenter {current_user.email}")
-        # Redirect to the session management page using the new database ID
-        return redirect(url_for('main.manage_session', class_session_id=new_class_session.id))
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error creating new ClassSession: {e}")
         flash("Could not start a new session. Please try again.", "error")
         return redirect(url_for('main.index')) # Or a teacher dashboard
 
+    try:
+        # The QR code URL points to the student login page with a signed join token,
+        # so joining students are admitted without a ClassSession lookup
+        join_url = url_for('main.student_login', token=make_join_token(new_class_session), _external=True)
+        qr_code_path, _ = generate_session_qr(join_url)
+        new_class_session.qr_code_url = qr_code_path # Store the path to the QR image
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error creating the QR code of ClassSession {new_class_session.id}: {e}")
+        flash("The session was started, but its QR code could not be created. Students can still join with the session code.", "warning")
+    # Redirect to the session management page using the new database ID
+    return redirect(url_for('main.manage_session', class_session_id=new_class_session.id))
+
 # --- Student Routes ---
 @main_bp.route('/student/login', methods=['GET'])
 def student_login():
+    join_token = request.args.get('token') # Signed token from the QR code
+    if join_token:
+        # Validated without a database read
+        joined = read_join_token(join_token)
+        if not joined:
+            flash("Invalid or expired session link.", "error")
+            return render_template('student_login.html', error="Invalid or expired session link.")
+        class_session_db_id, session_code = joined
+        session['current_class_session_id'] = class_session_db_id
+        session['current_session_code'] = session_code
+        session['join_token'] = join_token # Read (and dropped) by student_google_login instead of a ClassSession lookup
+        current_app.logger.info(f"Student attempting to join session with code: {session_code} (DB ID: {class_session_db_id}) via join token.")
+        return render_template('student_login.html', session_code=session_code)
+
     session_code_param = request.args.get('session_code') # Changed from session_id to session_code
     if not session_code_param:
         flash("Session code is required.", "error")
@@ -70,6 +97,7 @@ def student_login():
     # Store database ClassSession.id in Flask session for the student
     session['current_class_session_id'] = target_session.id 
     session['current_session_code'] = target_session.session_code # Keep for display if needed
+    session.pop('join_token', None)
     current_app.logger.info(f"Student attempting to join session with code: {session_code_param} (DB ID: {target_session.id}). Stored in session.")
     return render_template('student_login.html', session_code=session_code_param) # Pass code for display
 
@@ -80,10 +108,18 @@ def student_google_login():
         flash("Session information missing. Please try joining the session again via QR code or link.", "error")
         return redirect(url_for('main.index')) 
 
-    # Check if the session from Flask session is still active in DB
+    # Check if the session from Flask session is still active: from the join token if there is one, else from the DB
     class_session_db_id = session['current_class_session_id']
-    target_session = ClassSession.query.get(class_session_db_id)
-    if not target_session or not target_session.is_active:
+    # The token is only needed for this check, so it does not ride along on every later request;
+    # a retry after a failed Google login falls back to the DB check
+    join_token = session.pop('join_token', None)
+    joined = read_join_token(join_token) if join_token else None
+    if joined:
+        session_is_active = joined[0] == class_session_db_id
+    else:
+        target_session = ClassSession.query.get(class_session_db_id)
+        session_is_active = bool(target_session and target_session.is_active)
+    if not session_is_active:
         flash("The session you were trying to join is no longer active.", "error")
         # Clear potentially stale session vars
         session.pop('current_class_session_id', None)
@@ -138,13 +174,10 @@ def student_google_callback():
     target_session = ClassSession.query.get(class_session_db_id)
     if target_session and target_session.is_active:
         # Check if user is already associated with this session
-        is_already_joined = db.session.query(session_student_association).filter_by(
-            user_id=user.id, 
-            class_session_id=target_session.id
-        ).first() is not None
+        is_already_joined = target_session.has_student(user.id)
 
         if not is_already_joined:
-            target_session.students_in_session.append(user)
+            target_session.add_student(user.id)
             try:
                 db.session.commit()
                 current_app.logger.info(f"User {user.email} added to session {target_session.session_code}.")
@@ -199,6 +232,11 @@ def student_logout():
     return redirect(url_for('main.index')) # Redirect to a general landing or login page
 
 
+def _accepts_answer(live_state, question_db_id):
+    return bool(live_state and live_state.is_active and live_state.active_question_db_id == question_db_id
+                and live_state.active_question_status == 'open')
+
+
 @main_bp.route('/student/submit_answer', methods=['POST'])
 @login_required
 def student_submit_answer():
@@ -206,8 +244,9 @@ def student_submit_answer():
     if not class_session_db_id:
         return jsonify({'status': 'error', 'message': 'Session context not found. Please rejoin session.'}), 400
 
-    target_session = ClassSession.query.get(class_session_db_id)
-    if not target_session or not target_session.is_active:
+    # Session and question state come from the live state cache, not from a ClassSession query
+    live_state = get_live_state(class_session_db_id)
+    if not live_state or not live_state.is_active:
         return jsonify({'status': 'error', 'message': 'Classroom session is no longer active.'}), 403
 
     if not request.is_json:
@@ -226,57 +265,41 @@ def student_submit_answer():
     if not all([question_db_id_from_student, chosen_answer]):
         missing_fields = [f for f,v in [('question_db_id',question_db_id_from_student), ('chosen_answer',chosen_answer)] if not v]
         return jsonify({'status': 'error', 'message': f'Missing data: {", ".join(missing_fields)} required.'}), 400
+
+    chosen_answer_code = encode_answer(chosen_answer) # Stored as a small integer code
+    if chosen_answer_code is None:
+        return jsonify({'status': 'error', 'message': f'Invalid answer: choose one of {", ".join(ANSWER_LETTERS)}.'}), 400
     
-    # Validate against current active question in the session
-    if target_session.active_question_db_id != question_db_id_from_student or \
-       target_session.active_question_status != 'open':
+    # Validate against current active question in the session. The cached state may predate a question
+    # opened through another worker, so it is reloaded from the DB before an answer is rejected.
+    if not _accepts_answer(live_state, question_db_id_from_student):
+        live_state = get_live_state(class_session_db_id, force=True)
+    if not _accepts_answer(live_state, question_db_id_from_student):
+        if not live_state or not live_state.is_active:
+            return jsonify({'status': 'error', 'message': 'Classroom session is no longer active.'}), 403
         current_app.logger.warning(
-            f"Rejected answer from user {current_user.id} for ClassSession {target_session.id}. "
-            f"Student submitted for Q_DB_ID:{question_db_id_from_student}, session active Q_DB_ID:{target_session.active_question_db_id} (status:{target_session.active_question_status})"
+            f"Rejected answer from user {current_user.id} for ClassSession {live_state.class_session_id}. "
+            f"Student submitted for Q_DB_ID:{question_db_id_from_student}, session active Q_DB_ID:{live_state.active_question_db_id} (status:{live_state.active_question_status})"
         )
         return jsonify({'status': 'error', 'message': 'Question is not currently open for answers or ID mismatch.'}), 403
 
-    # Create and save the StudentResponse
+    # Single INSERT; a re-submission is rejected by the _student_session_question_uc constraint
     try:
-        existing_response = StudentResponse.query.filter_by(
-            student_id=current_user.id,
-            class_session_id=target_session.id,
-            question_id=question_db_id_from_student
-        ).first()
-
-        if existing_response:
-            # Depending on policy, either update or reject. For now, reject re-submission.
-            return jsonify({'status': 'error', 'message': 'You have already answered this question.'}), 409 # 409 Conflict
-            # If updating:
-            # existing_response.chosen_answer = chosen_answer
-            # existing_response.submitted_at = datetime.utcnow()
-            # message = f'Answer updated to "{chosen_answer}".'
-        else:
-            new_response = StudentResponse(
-                student_id=current_user.id,
-                class_session_id=target_session.id,
-                question_id=question_db_id_from_student, # This must be Question.id (PK)
-                chosen_answer=chosen_answer
-            )
-            db.session.add(new_response)
-            message = f'Answer "{chosen_answer}" received.'
-        
-        db.session.commit()
-        question_ref_id_display = Question.query.get(question_db_id_from_student).question_ref_id
-        current_app.logger.info(
-            f"Answer by user {current_user.id} for Q_REF_ID '{question_ref_id_display}' (DB_ID: {question_db_id_from_student}) "
-            f"in ClassSession {target_session.id}: {chosen_answer}"
-        )
-        return jsonify({'status': 'success', 'message': message}), 200
-
-    except Exception as e: # Catches IntegrityError from UniqueConstraint or other DB errors
+        inserted = insert_student_response(current_user.id, live_state.class_session_id, question_db_id_from_student, chosen_answer_code)
+    except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Error submitting answer for user {current_user.id}, Q_DB_ID {question_db_id_from_student}, session {target_session.id}: {e}")
-        # Check if it's a unique constraint violation
-        if "UNIQUE constraint failed" in str(e) or "Duplicate entry" in str(e): # Adapt based on DB engine
-             return jsonify({'status': 'error', 'message': 'You have already answered this question for this session.'}), 409
+        current_app.logger.error(f"Error submitting answer for user {current_user.id}, Q_DB_ID {question_db_id_from_student}, session {live_state.class_session_id}: {e}")
         return jsonify({'status': 'error', 'message': 'Could not save your answer due to a server error.'}), 500
 
+    if not inserted:
+        return jsonify({'status': 'error', 'message': 'You have already answered this question.'}), 409 # 409 Conflict
+
+    current_app.logger.info(
+        f"Answer by user {current_user.id} for Q_REF_ID '{live_state.active_question_ref_id}' (DB_ID: {question_db_id_from_student}) "
+        f"in ClassSession {live_state.class_session_id}: {chosen_answer}"
+    )
+    return jsonify({'status': 'success', 'message': f'Answer "{chosen_answer}" received.'}), 200
+
 
 # --- Teacher Question Management Routes ---
 @main_bp.route('/teacher/set_active_question', methods=['POST'])
@@ -314,6 +337,7 @@ def set_active_question():
     target_session.active_question_status = 'open'
     try:
         db.session.commit()
+        refresh_live_state(target_session)
         flash(f"Question '{question_to_activate.question_ref_id}' is now active for session {target_session.session_code}.", "success")
         current_app.logger.info(f"Teacher {current_user.email} set active question for ClassSession ID {target_session.id} to Question DB ID {question_to_activate.id} with status 'open'")
     except Exception as e:
@@ -344,7 +368,7 @@ def manage_session(class_session_id):
     
     current_question_status = target_session.active_question_status if target_session.active_question_status else 'none'
     
-    num_joined_students = target_session.students_in_session.count()
+    num_joined_students = target_session.count_students()
 
     num_responses_for_current_question = 0
     if current_active_question_from_db: # Ensure we have a question object
@@ -366,6 +390,25 @@ def manage_session(class_session_id):
                            num_responses_for_current_question=num_responses_for_current_question)
 
 
+@main_bp.route('/teacher/session/<int:class_session_id>/changes')
+@login_required
+def manage_session_changes(class_session_id):
+    """
+    Polled by the management page: returns only the session fields (status, counts, answer histogram)
+    changed since the version the page last saw, so it can patch itself without a full reload.
+    """
+    live_state = get_live_state(class_session_id)
+    if not live_state:
+        return jsonify({'status': 'error', 'message': 'Session not found.'}), 404
+
+    if live_state.presenter_id != current_user.id:
+        return jsonify({'status': 'error', 'message': 'You are not authorized to manage this session.'}), 403
+
+    since_version = request.args.get('since', type=int)
+    version, changes, is_full = session_changes(live_state, since_version, request.args.get('epoch'))
+    return jsonify({'status': 'success', 'epoch': CHANGES_EPOCH, 'version': version, 'full': is_full, 'changes': changes})
+
+
 @main_bp.route('/teacher/close_question', methods=['POST'])
 @login_required
 def teacher_close_question():
@@ -399,6 +442,7 @@ def teacher_close_question():
     target_session.active_question_status = 'closed'
     try:
         db.session.commit()
+        refresh_live_state(target_session)
         closed_question = Question.query.get(question_db_id_to_close) # Fetch again for ref_id
         flash(f"Question '{closed_question.question_ref_id if closed_question else question_db_id_to_close}' has been closed for answers.", "info")
         current_app.logger.info(f"Teacher {current_user.email} closed question (DB ID: {question_db_id_to_close}) for ClassSession ID {class_session_db_id}")
@@ -451,70 +495,13 @@ def teacher_session_results(class_session_id):
         flash("You are not authorized to view results for this session.", "error")
         return redirect(url_for('main.index'))
 
-    # Fetch all students who were part of this session
-    # students_in_this_session = target_session.students_in_session.all() # This is a list of User objects
-    
-    # Fetch all responses for this session
-    all_responses_for_session = StudentResponse.query.filter_by(class_session_id=target_session.id).all()
-    
-    # Fetch all questions (to get correct answers and text)
-    all_questions = Question.query.order_by(Question.id).all()
-
-    scores = {}
-    # Initialize scores for all students who joined the session
-    for student_user in target_session.students_in_session: # Iterate over User objects
-        scores[student_user.id] = {
-            'name': student_user.name,
-            'email': student_user.email,
-            'score': 0,
-            'answers': {} # q_id -> {'chosen': 'A', 'correct': 'C', 'is_correct': False, 'question_text': ...}
-        }
-
-    # Process responses
-    for response in all_responses_for_session:
-        student_id = response.student_id
-        question_id = response.question_id # This is Question.id (PK)
-        
-        # Find the question details (correct answer, text)
-        question_details = next((q for q in all_questions if q.id == question_id), None)
-        if not question_details:
-            current_app.logger.warning(f"Response found for Q_DB_ID {question_id} but question not in all_questions list. Skipping.")
-            continue
-
-        correct_answer = question_details.correct_answer
-        is_correct = (response.chosen_answer == correct_answer)
-        
-        if student_id in scores: # Should always be true if student joined session properly
-            if is_correct:
-                scores[student_id]['score'] += 1
-            
-            scores[student_id]['answers'][question_id] = { # Use Question DB ID as key
-                'chosen': response.chosen_answer,
-                'correct': correct_answer,
-                'is_correct': is_correct,
-                'question_text': question_details.text,
-                'question_ref_id': question_details.question_ref_id # For display
-            }
-        else:
-             current_app.logger.warning(f"Response found from student ID {student_id} who is not in the session's student list (scores dict). Response ID: {response.id}")
-
-
-    # Fill in answers for questions students didn't respond to
-    for student_id in scores:
-        for question in all_questions:
-            if question.id not in scores[student_id]['answers']:
-                 scores[student_id]['answers'][question.id] = {
-                    'chosen': None, # Or 'N/A'
-                    'correct': question.correct_answer,
-                    'is_correct': False,
-                    'question_text': question.text,
-                    'question_ref_id': question.question_ref_id
-                }
-
-
-    sorted_scores_list = sorted(scores.values(), key=lambda x: x['score'], reverse=True)
+    # Answers as a student x question matrix of answer codes; scores are computed on the arrays and
+    # question text and letters are joined in by the template (from the archive if the session has been archived)
+    from .results import build_session_results, session_result_rows # NumPy stays off the startup path
+    results = build_session_results(target_session)
+    sorted_scores_list = session_result_rows(results)
     top_3_students = sorted_scores_list[:3]
-    total_participants = target_session.students_in_session.count()
+    total_participants = target_session.count_students()
 
 
     return render_template('teacher_session_results.html',
@@ -522,7 +509,27 @@ def teacher_session_results(class_session_id):
                            sorted_scores=sorted_scores_list,
                            top_3_students=top_3_students,
                            total_participants=total_participants,
-                           quiz_questions_map={q.id: q for q in all_questions}) # Pass a map for easy lookup by id
+                           questions=results.questions, # Column order of each student's answer_codes
+                           decode_answer=decode_answer)
+
+# --- Teacher Analytics Routes ---
+# Aggregated across all sessions presented by the current teacher, including archived ones.
+# The analytics module (and NumPy) is imported on first use to keep it off the startup path.
+@main_bp.route('/teacher/analytics/questions')
+@login_required
+def teacher_question_analytics():
+    from .analytics import question_statistics
+    return jsonify({'status': 'success', 'questions': question_statistics(presenter_id=current_user.id)})
+
+@main_bp.route('/teacher/analytics/students/<int:student_id>')
+@login_required
+def teacher_student_analytics(student_id):
+    from .analytics import PERIOD_SECONDS, student_accuracy_history
+    period = request.args.get('period', 'week')
+    if period not in PERIOD_SECONDS:
+        return jsonify({'status': 'error', 'message': f'Invalid period. Use one of: {", ".join(PERIOD_SECONDS)}.'}), 400
+    history = student_accuracy_history(period=period, presenter_id=current_user.id, student_id=student_id)
+    return jsonify({'status': 'success', 'student_id': student_id, 'period': period, 'history': history})
 
 @main_bp.route('/teacher/end_session', methods=['POST'])
 @login_required
@@ -546,6 +553,8 @@ def teacher_end_session():
     
     try:
         db.session.commit()
+        forget_session(target_session.id) # The ended session no longer needs cached state in this process
+        revoke_session(target_session.id) # Outstanding join tokens stop working
         flash(f"Session {target_session.session_code} has been ended. Results are now final.", "info")
         current_app.logger.info(f"Teacher {current_user.email} ended ClassSession ID {target_session.id}.")
     except Exception as e:
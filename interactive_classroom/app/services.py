@@ -1,10 +1,11 @@
-import qrcode
 import uuid
 import os
 # User model is now from DB, users_db and next_user_id are removed
-from .models import User 
+from .models import User, StudentResponse
 from app import db # Import db instance
 from flask import current_app, url_for
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 
 # Business logic (e.g., QR generation, auth) will be defined here
 
@@ -58,6 +59,35 @@ def get_or_create_user(email, name, google_id):
         return None 
     return user
 
+def insert_student_response(student_id, class_session_id, question_db_id, chosen_answer_code):
+    """
+    Records an answer with a single INSERT and commits it.
+    Returns False if the student already answered this question in this session,
+    as reported by the _student_session_question_uc constraint.
+    Any other integrity error (e.g. a foreign key to a deleted row) is re-raised.
+    """
+    try:
+        db.session.execute(insert(StudentResponse).values(
+            student_id=student_id,
+            class_session_id=class_session_id,
+            question_id=question_db_id,
+            chosen_answer_code=chosen_answer_code,
+        ))
+        db.session.commit()
+    except IntegrityError:
+        # SQLAlchemy raises IntegrityError for every constraint violation regardless of the DB driver,
+        # so the duplicate is confirmed with one lookup instead of parsing driver-specific messages
+        db.session.rollback()
+        already_answered = db.session.query(StudentResponse.id).filter_by(
+            student_id=student_id,
+            class_session_id=class_session_id,
+            question_id=question_db_id,
+        ).first() is not None
+        if already_answered:
+            return False
+        raise
+    return True
+
 def get_google_auth_flow(redirect_uri):
     """
     Prepares the Google OAuth flow.
@@ -117,13 +147,15 @@ def process_google_callback(authorization_response_url, redirect_uri):
     return {'name': 'Mock Test User', 'email': 'mock.test.user@example.com', 'google_id': 'mock_google_id_123'}
 
 
-def generate_session_qr(base_url="http://127.0.0.1:5000"):
+def generate_session_qr(login_url):
     """
-    Generates a unique session ID, creates a QR code for the student login URL,
-    saves the QR code image, and returns the path to the image and the session ID.
+    Creates a QR code encoding the given student login URL (which carries the signed join token),
+    saves the QR code image, and returns the path to the image and the image's unique ID.
     """
-    session_id = uuid.uuid4()
-    login_url = f"{base_url}/student/login?session_id={str(session_id)}"
+    # qrcode pulls in PIL; imported here so only starting a session pays for it, not every worker and CLI run
+    import qrcode
+
+    image_id = uuid.uuid4()
 
     # Create QR code
     img = qrcode.make(login_url)
@@ -133,10 +165,10 @@ def generate_session_qr(base_url="http://127.0.0.1:5000"):
     os.makedirs(qr_code_dir, exist_ok=True)
 
     # Save the QR code image
-    image_filename = f"session_{str(session_id)}.png"
+    image_filename = f"session_{str(image_id)}.png"
     image_path = os.path.join(qr_code_dir, image_filename)
     img.save(image_path)
 
-    # Return the URL path to the image and the session ID
+    # Return the URL path to the image and the image ID
     qr_code_url_path = f"/static/qr_codes/{image_filename}"
-    return qr_code_url_path, str(session_id)
+    return qr_code_url_path, str(image_id)
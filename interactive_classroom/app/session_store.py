@@ -0,0 +1,293 @@
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Optional server-side sessions.
+# With SESSION_STORE set to 'memory', 'sqlite' or 'redis', the session cookie only carries a short
+# random id; the session data (current_class_session_id, oauth_state, Flask-Login keys...) lives in
+# the store. Requests that do not change the session (e.g. student polling) skip signing, serializing
+# and the Set-Cookie header, and the store is only written when the session changed or is about
+# to expire. The default ('cookie') keeps Flask's signed cookie session.
+
+SESSION_ID_BYTES = 16 # token_urlsafe(16) gives a 22 character id
+DEFAULT_SESSION_STORE_TTL = 12 * 60 * 60 # Seconds a non-permanent session lives without activity
+DEFAULT_SESSION_STORE_MAX_ENTRIES = 10000 # Memory store only; least recently used sessions are dropped
+DEFAULT_SESSION_STORE_PURGE_INTERVAL = 60.0 # Seconds between sweeps of expired sessions
+DEFAULT_SQLITE_SESSION_PATH = 'sessions.db'
+
+_SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+class SessionStoreStats:
+    """Per-process counters, see ServerSideSessionInterface.stats."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.deletes = 0
+        self.purged = 0
+        self.lookup_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'deletes': self.deletes,
+            'purged': self.purged,
+            'mean_lookup_ms': self.lookup_seconds * 1000 / self.lookups if self.lookups else 0.0,
+        }
+
+
+# --- Backends ---
+# Each backend stores (serialized data, expires_at) per session id and returns None for
+# missing or expired ids. expires_at is a time.time() timestamp.
+
+class MemorySessionStore:
+    """Per-process LRU dict. Only suitable for a single worker process."""
+
+    def __init__(self, max_entries=DEFAULT_SESSION_STORE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None or entry[1] <= time.time():
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def set(self, sid, data, expires_at):
+        with self._lock:
+            self._entries[sid] = (data, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._entries.items() if expires_at <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    """Sessions in a separate SQLite file, shared by all worker processes on the host."""
+
+    def __init__(self, path=DEFAULT_SQLITE_SESSION_PATH):
+        self.path = path
+        self._local = threading.local() # sqlite3 connections cannot be shared between threads
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS flask_session ('
+                               'sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_flask_session_expires_at ON flask_session (expires_at)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL') # Losing the last sessions on power loss is acceptable
+            self._local.connection = connection
+        return connection
+
+    def get(self, sid):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM flask_session WHERE sid = ? AND expires_at > ?', (sid, time.time())).fetchone()
+        return row
+
+    def set(self, sid, data, expires_at):
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO flask_session (sid, data, expires_at) VALUES (?, ?, ?)',
+                               (sid, data, expires_at))
+
+    def delete(self, sid):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM flask_session WHERE sid = ?', (sid,))
+
+    def purge_expired(self):
+        with self._connection() as connection:
+            return connection.execute('DELETE FROM flask_session WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class RedisSessionStore:
+    """Sessions in Redis (or anything speaking its protocol). Redis expires keys itself."""
+
+    key_prefix = 'session:'
+
+    def __init__(self, url):
+        import redis # Optional dependency, only needed with SESSION_STORE=redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, sid):
+        key = self.key_prefix + sid
+        with self._redis.pipeline() as pipe:
+            data, ttl_ms = pipe.get(key).pttl(key).execute()
+        if data is None or ttl_ms < 0:
+            return None
+        return data, time.time() + ttl_ms / 1000
+
+    def set(self, sid, data, expires_at):
+        self._redis.set(self.key_prefix + sid, data, px=max(1, int((expires_at - time.time()) * 1000)))
+
+    def delete(self, sid):
+        self._redis.delete(self.key_prefix + sid)
+
+    def purge_expired(self):
+        return 0
+
+
+def create_session_store(app):
+    """Builds the backend named by SESSION_STORE, or returns None for the default cookie sessions."""
+    kind = (app.config.get('SESSION_STORE') or 'cookie').lower()
+    url = app.config.get('SESSION_STORE_URL')
+    if kind == 'cookie':
+        return None
+    if kind == 'memory':
+        return MemorySessionStore(app.config.get('SESSION_STORE_MAX_ENTRIES', DEFAULT_SESSION_STORE_MAX_ENTRIES))
+    if kind == 'sqlite':
+        return SQLiteSessionStore(url or DEFAULT_SQLITE_SESSION_PATH)
+    if kind == 'redis':
+        return RedisSessionStore(url or 'redis://localhost:6379/0')
+    raise ValueError(f"Unknown SESSION_STORE {kind!r}; expected cookie, memory, sqlite or redis.")
+
+
+# --- Session interface ---
+
+class ServerSideSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.initial_user_id = self.get('_user_id')
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer() # Same format as Flask's cookie sessions
+
+    def __init__(self, store, ttl=DEFAULT_SESSION_STORE_TTL, purge_interval=DEFAULT_SESSION_STORE_PURGE_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.stats = SessionStoreStats()
+        self._last_purge = time.monotonic()
+
+    def _lifetime(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return self.ttl
+
+    def _purge_if_due(self):
+        # Expired sessions are removed in one sweep every purge_interval instead of on each request
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        self.stats.purged += self.store.purge_expired()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SESSION_ID_PATTERN.match(sid):
+            return ServerSideSession() # No cookie, or an old signed cookie session
+
+        start = time.perf_counter()
+        entry = self.store.get(sid)
+        self.stats.lookups += 1
+        self.stats.lookup_seconds += time.perf_counter() - start
+        if entry is None:
+            self.stats.misses += 1
+            return ServerSideSession()
+        self.stats.hits += 1
+        try:
+            data = self.serializer.loads(entry[0])
+        except ValueError:
+            return ServerSideSession()
+        return ServerSideSession(data, sid=sid, expires_at=entry[1])
+
+    def save_session(self, app, session, response):
+        self._purge_if_due()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.sid is not None and session.modified: # Session was emptied, e.g. logout
+                self.store.delete(session.sid)
+                self.stats.deletes += 1
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = self._lifetime(app, session)
+        now = time.time()
+        # Unchanged sessions are only rewritten once less than half their lifetime is left
+        refresh_due = session.expires_at is not None and session.expires_at - now < lifetime / 2
+        if not (session.new or session.modified or refresh_due):
+            return
+
+        sid = session.sid
+        if sid is None or session.get('_user_id') != session.initial_user_id:
+            # New id on login or user change so a session id seen before login cannot be reused
+            if sid is not None:
+                self.store.delete(sid)
+                self.stats.deletes += 1
+            sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+
+        self.store.set(sid, self.serializer.dumps(dict(session)), now + lifetime)
+        self.stats.writes += 1
+        if sid != session.sid or session.permanent:
+            response.set_cookie(
+                name,
+                sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add('Cookie')
+
+
+def init_session_store(app):
+    store = create_session_store(app)
+    if store is None:
+        return
+    ttl = app.config.get('SESSION_STORE_TTL', DEFAULT_SESSION_STORE_TTL)
+    if isinstance(ttl, timedelta):
+        ttl = ttl.total_seconds()
+    app.session_interface = ServerSideSessionInterface(
+        store,
+        ttl=ttl,
+        purge_interval=app.config.get('SESSION_STORE_PURGE_INTERVAL', DEFAULT_SESSION_STORE_PURGE_INTERVAL),
+    )
+    app.logger.debug(f"Server-side sessions enabled ({type(store).__name__}).")
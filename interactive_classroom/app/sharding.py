@@ -0,0 +1,237 @@
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+import sqlalchemy as sa
+from flask import current_app, g, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.util import find_tables
+
+# Optional per-classroom sharding.
+# With SHARD_DATABASE_URIS set, ClassSession, StudentResponse, the roster table and the session archive
+# live in one of N shard databases chosen by session_code; User and Question stay in the catalog
+# (SQLALCHEMY_DATABASE_URI). A shard can be a separate SQLite file or a PostgreSQL schema
+# (e.g. postgresql:///classroom?options=-csearch_path%3Dshard_1,public).
+#
+# ClassSession ids are allocated so that id % N is the shard index, which lets routes that only know
+# a class_session_id resolve the shard without a lookup. Queries touching sharded tables go to the
+# shard selected for the current request (or by use_shard()); queries mixing catalog and sharded
+# tables are not possible and are not issued anywhere.
+#
+# Because of that, every shard records its index and the number of shards it was created with, and the
+# app refuses to start if SHARD_DATABASE_URIS no longer matches: adding, removing or reordering a URI
+# would otherwise send existing sessions to the wrong database. Changing the list needs a data migration.
+
+SHARDED_TABLES = frozenset({'class_session', 'student_response', 'session_student_association', 'session_archive', 'shard_id_counter'})
+CLASS_SESSION_COUNTER = 'class_session' # shard_id_counter row holding the next ClassSession id of a shard
+SHARD_INDEX_ROW = 'shard_index' # shard_id_counter rows holding the shard layout a shard was created with
+SHARD_COUNT_ROW = 'shard_count'
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+class ShardRoutingError(RuntimeError):
+    """A sharded table was used while no shard was selected."""
+
+
+class ShardLayoutError(RuntimeError):
+    """SHARD_DATABASE_URIS does not match the shard layout recorded in the shard databases."""
+
+
+def shard_bind_key(index):
+    return f'shard_{index}'
+
+
+def shard_count():
+    """Number of configured shards; 0 when sharding is disabled."""
+    return len(current_app.config.get('SHARD_DATABASE_URIS') or ())
+
+
+def shard_for_session_code(session_code):
+    return zlib.crc32(session_code.encode('utf-8')) % shard_count()
+
+
+def shard_for_class_session_id(class_session_id):
+    return int(class_session_id) % shard_count()
+
+
+def _touches_sharded_table(mapper, clause):
+    if mapper is not None:
+        return sa.inspect(mapper).local_table.name in SHARDED_TABLES
+    if clause is not None:
+        return any(getattr(table, 'name', None) in SHARDED_TABLES for table in find_tables(clause, include_crud=True))
+    return False
+
+
+class ShardedSession(Session):
+    """Sends statements on sharded tables to the engine of the selected shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and current_app.config.get('SHARD_DATABASE_URIS') and _touches_sharded_table(mapper, clause):
+            index = _current_shard.get()
+            if index is None:
+                raise ShardRoutingError("No shard selected for a query on a sharded table; use use_shard() or route_to_shard().")
+            return self._db.engines[shard_bind_key(index)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_shard(index):
+    """Selects a shard for the enclosed block (CLI commands, scripts)."""
+    token = _current_shard.set(index)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def for_each_shard():
+    """
+    Iterates over all shards, selecting each in turn; yields the shard index.
+    Without sharding it yields None once, so callers can loop unconditionally.
+    """
+    if not shard_count():
+        yield None
+        return
+    for index in range(shard_count()):
+        with use_shard(index):
+            yield index
+
+
+def route_to_shard(index):
+    """Selects the shard for the rest of the current request."""
+    token = _current_shard.set(index)
+    if '_shard_token' not in g:
+        g._shard_token = token
+
+
+def _first_free_class_session_id(index):
+    """Next id congruent to `index` after the ClassSessions already in the selected shard."""
+    from app import db # Local imports: app/__init__.py imports this module to build db
+    from .models import ClassSession
+    highest_id = db.session.query(sa.func.max(ClassSession.id)).scalar()
+    if highest_id is None:
+        return index or shard_count() # Ids start at 1
+    return highest_id + shard_count() # Every id in this shard is congruent to index
+
+
+def _insert_missing_rows(values):
+    """INSERT of shard_id_counter rows into the selected shard that leaves rows created earlier (or by another request) alone."""
+    from app import db
+    from .models import shard_id_counter
+    if db.session.get_bind(clause=shard_id_counter.insert()).dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(shard_id_counter).values(values).on_conflict_do_nothing()
+
+
+def _counter_row(index):
+    return {'name': CLASS_SESSION_COUNTER, 'next_value': _first_free_class_session_id(index)}
+
+
+def next_class_session_id(index):
+    """
+    Id for a new ClassSession in shard `index`, which must be the selected shard.
+    Ids come from the shard's counter row, bumped with one UPDATE ... RETURNING in the request
+    transaction. The row (on SQLite the database) stays write-locked until commit, so concurrent
+    requests never get the same id.
+    """
+    from app import db
+    from .models import shard_id_counter
+    step = shard_count()
+    bump = sa.update(shard_id_counter).where(shard_id_counter.c.name == CLASS_SESSION_COUNTER) \
+        .values(next_value=shard_id_counter.c.next_value + step).returning(shard_id_counter.c.next_value)
+    next_value = db.session.execute(bump).scalar()
+    if next_value is None: # Shard created before the counter existed; create-db normally seeds it
+        db.session.execute(_insert_missing_rows([_counter_row(index)]))
+        next_value = db.session.execute(bump).scalar()
+    return next_value - step
+
+
+def allocate_class_session_id(session_code):
+    """
+    Selects the shard of a new ClassSession for the current request and returns the id it must use,
+    or None when sharding is disabled and the database assigns ids.
+    """
+    if not shard_count():
+        return None
+    index = shard_for_session_code(session_code)
+    route_to_shard(index)
+    return next_class_session_id(index)
+
+
+def _route_request():
+    if not shard_count():
+        return
+    class_session_id = (request.view_args or {}).get('class_session_id') or request.form.get('class_session_id', type=int)
+    if class_session_id:
+        route_to_shard(shard_for_class_session_id(class_session_id))
+    elif request.args.get('session_code'):
+        route_to_shard(shard_for_session_code(request.args['session_code']))
+    elif session.get('current_class_session_id'):
+        route_to_shard(shard_for_class_session_id(session['current_class_session_id']))
+
+
+def _reset_request_shard(exc):
+    token = g.pop('_shard_token', None)
+    if token is not None:
+        _current_shard.reset(token)
+
+
+def configure_shard_binds(app):
+    """Adds one SQLALCHEMY_BINDS entry per shard URI. Must run before db.init_app."""
+    uris = app.config.get('SHARD_DATABASE_URIS') or ()
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for index, uri in enumerate(uris):
+        binds[shard_bind_key(index)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _recorded_layout(index):
+    """(shard index, shard count) recorded in the database of shard `index`, or None if it has none yet."""
+    from app import db
+    from .models import shard_id_counter
+    engine = db.engines[shard_bind_key(index)]
+    if not sa.inspect(engine).has_table(shard_id_counter.name):
+        return None # create-db has not run yet
+    with engine.connect() as connection:
+        rows = dict(connection.execute(sa.select(shard_id_counter.c.name, shard_id_counter.c.next_value)
+                                       .where(shard_id_counter.c.name.in_([SHARD_INDEX_ROW, SHARD_COUNT_ROW]))).all())
+    if len(rows) < 2:
+        return None # Created before layouts were recorded; create-db records it
+    return rows[SHARD_INDEX_ROW], rows[SHARD_COUNT_ROW]
+
+
+def check_shard_layout():
+    """Raises ShardLayoutError if a shard URI was added, removed or reordered since the shards were created."""
+    for index in range(shard_count()):
+        recorded = _recorded_layout(index)
+        if recorded is not None and recorded != (index, shard_count()):
+            raise ShardLayoutError(
+                f"SHARD_DATABASE_URIS entry {index} is shard {recorded[0]} of {recorded[1]}, but {shard_count()} shard(s) "
+                f"are configured. Sessions are routed by id % number of shards, so shard URIs cannot be added, removed "
+                f"or reordered without moving their sessions; restore the original list.")
+
+
+def init_sharding(app):
+    if app.config.get('SHARD_DATABASE_URIS'):
+        with app.app_context():
+            check_shard_layout()
+    app.before_request(_route_request)
+    app.teardown_request(_reset_request_shard)
+
+
+def create_shard_tables():
+    """Creates the sharded tables in every shard database and records the shard layout in each."""
+    from app import db
+    tables = [table for name, table in db.metadata.tables.items() if name in SHARDED_TABLES]
+    for index in range(shard_count()):
+        db.metadata.create_all(bind=db.engines[shard_bind_key(index)], tables=tables)
+        with use_shard(index):
+            db.session.execute(_insert_missing_rows([
+                _counter_row(index),
+                {'name': SHARD_INDEX_ROW, 'next_value': index},
+                {'name': SHARD_COUNT_ROW, 'next_value': shard_count()},
+            ]))
+            db.session.commit()
+    check_shard_layout() # Shards that already had a layout keep theirs
@@ -0,0 +1,95 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from flask import current_app, g, request, session
+from flask_login import current_user
+
+# Opt-in traffic recorder for replaying real lectures in benchmarks (see benchmarks/replay.py).
+# With TRAFFIC_RECORD_PATH set, every request appends one JSON line with its start time, endpoint,
+# status, duration and the parameters a replay needs. Users and class sessions are written as keyed
+# pseudonyms; names, emails, session codes, tokens and OAuth data are never written.
+
+RECORD_FORMAT_VERSION = 1
+SKIPPED_ENDPOINTS = ('static', 'fingerprinted_asset') # Cached by the browser, not part of the lecture load
+
+_write_lock = threading.Lock()
+_record_files = {}
+
+
+def pseudonym(kind, value):
+    """Stable within an app (same SECRET_KEY) and across worker processes, but not reversible without the key."""
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, f'traffic:{kind}:{value}'.encode(), hashlib.sha256).hexdigest()[:10]
+
+
+def _class_session_id():
+    class_session_id = (request.view_args or {}).get('class_session_id') or request.form.get('class_session_id', type=int)
+    return class_session_id or session.get('current_class_session_id')
+
+
+def _request_shape():
+    """The replay-relevant parameters of the current request."""
+    shape = {}
+    if current_user.is_authenticated:
+        shape['u'] = pseudonym('user', current_user.id)
+    class_session_id = _class_session_id()
+    if class_session_id:
+        shape['cs'] = pseudonym('class_session', class_session_id)
+
+    data = request.get_json(silent=True) if request.is_json else None
+    if isinstance(data, dict): # student_submit_answer
+        question_db_id, answer = data.get('question_db_id'), data.get('chosen_answer')
+    else: # set_active_question / close_question
+        question_db_id, answer = request.form.get('question_db_id', type=int), None
+    if isinstance(question_db_id, int):
+        shape['q'] = question_db_id # Question ids are course content, not personal data
+    if isinstance(answer, str) and len(answer) == 1:
+        shape['a'] = answer
+    if 'since' in request.args:
+        shape['since'] = 1 # Presence only, versions do not carry over to a replay
+    if request.args.get('token'):
+        shape['join'] = 'token'
+    elif request.args.get('session_code'):
+        shape['join'] = 'code'
+    return shape
+
+
+def _start_timer():
+    g._traffic_started = (time.time(), time.perf_counter())
+
+
+def _record_request(response):
+    started = g.pop('_traffic_started', None)
+    if started is None or request.endpoint in SKIPPED_ENDPOINTS:
+        return response
+    record = {
+        'ts': round(started[0], 4),
+        'ep': request.endpoint,
+        'm': request.method,
+        'st': response.status_code,
+        'ms': round((time.perf_counter() - started[1]) * 1000, 3),
+    }
+    try:
+        record.update(_request_shape())
+    except Exception as e: # Recording must never break a request
+        current_app.logger.warning(f"Traffic recorder could not describe {request.endpoint}: {e}")
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+
+    path = current_app.config['TRAFFIC_RECORD_PATH']
+    with _write_lock:
+        record_file = _record_files.get(path)
+        if record_file is None:
+            # Append mode with one write per line keeps lines whole when several workers share the file
+            record_file = _record_files[path] = open(path, 'a', buffering=1, encoding='utf-8')
+        record_file.write(line)
+    return response
+
+
+def init_traffic_recorder(app):
+    if not app.config.get('TRAFFIC_RECORD_PATH'):
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.logger.info(f"Recording traffic (format {RECORD_FORMAT_VERSION}) to {app.config['TRAFFIC_RECORD_PATH']}.")
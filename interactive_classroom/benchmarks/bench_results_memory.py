@@ -0,0 +1,119 @@
+"""
+Compares the memory of the session results page data: nested per-answer dicts vs answer code arrays.
+
+    python -m benchmarks.bench_results_memory --students 1000 --questions 500
+
+Seeds one session where every student answers every question, then builds the data that
+teacher_session_results passes to its template, both ways, under tracemalloc. "retained" is what
+is still allocated once the build returns (the results handed to the template); "peak" includes
+the rows loaded from the database while building. The legacy build is the old route code, except
+that it finds questions with a dict instead of a linear search, so its time is not dominated by
+that search.
+"""
+import argparse
+import gc
+import os
+import random
+import tempfile
+import tracemalloc
+from app import db
+from app.models import ClassSession, Question, StudentResponse, User, encode_answer
+from app.results import build_session_results, session_result_rows
+from benchmarks.harness import Timer, create_benchmark_app, seed_classroom
+
+
+def legacy_results(class_session):
+    all_responses_for_session = StudentResponse.query.filter_by(class_session_id=class_session.id).all()
+    all_questions = Question.query.order_by(Question.id).all()
+    questions_by_id = {q.id: q for q in all_questions}
+
+    scores = {}
+    for student_user in User.query.filter(User.id.in_(class_session.student_ids())):
+        scores[student_user.id] = {'name': student_user.name, 'email': student_user.email, 'score': 0, 'answers': {}}
+
+    for response in all_responses_for_session:
+        question_details = questions_by_id.get(response.question_id)
+        if not question_details or response.student_id not in scores:
+            continue
+        is_correct = (response.chosen_answer == question_details.correct_answer)
+        if is_correct:
+            scores[response.student_id]['score'] += 1
+        scores[response.student_id]['answers'][response.question_id] = {
+            'chosen': response.chosen_answer,
+            'correct': question_details.correct_answer,
+            'is_correct': is_correct,
+            'question_text': question_details.text,
+            'question_ref_id': question_details.question_ref_id,
+        }
+
+    for student_id in scores:
+        for question in all_questions:
+            if question.id not in scores[student_id]['answers']:
+                scores[student_id]['answers'][question.id] = {
+                    'chosen': None, 'correct': question.correct_answer, 'is_correct': False,
+                    'question_text': question.text, 'question_ref_id': question.question_ref_id,
+                }
+
+    sorted_scores_list = sorted(scores.values(), key=lambda x: x['score'], reverse=True)
+    return sorted_scores_list, {q.id: q for q in all_questions}
+
+
+def array_results(class_session):
+    results = build_session_results(class_session)
+    return session_result_rows(results), results
+
+
+def seed_session(num_students, num_questions):
+    for i in range(num_questions - Question.query.count()):
+        db.session.add(Question(question_ref_id=f'bench-q{i}', text=f'Benchmark question number {i}?',
+                                option_a='Alpha', option_b='Beta', option_c='Gamma', option_d='Delta',
+                                correct_answer=random.choice('ABCD')))
+    db.session.commit()
+    class_session_id, _, student_ids = seed_classroom(num_students, open_question=False)
+    question_ids = [question_id for (question_id,) in db.session.query(Question.id)]
+    rows = [{'student_id': student_id, 'class_session_id': class_session_id, 'question_id': question_id,
+             'chosen_answer_code': encode_answer(random.choice('ABCD'))}
+            for student_id in student_ids for question_id in question_ids]
+    for start in range(0, len(rows), 50000):
+        db.session.execute(StudentResponse.__table__.insert(), rows[start:start + 50000])
+    db.session.commit()
+    return class_session_id, len(rows)
+
+
+def measure(build, class_session_id):
+    db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    with Timer() as timer:
+        result = build(db.session.get(ClassSession, class_session_id))
+    db.session.expunge_all() # Drop loaded rows the results do not reference
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current - before, peak - before, timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_benchmark_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            class_session_id, num_responses = seed_session(args.students, args.questions)
+            print(f"{args.students} students x {args.questions} questions, {num_responses} responses")
+            measured = {}
+            for name, build in (('legacy', legacy_results), ('arrays', array_results)):
+                retained, peak, elapsed = measure(build, class_session_id)
+                measured[name] = retained
+                print(f"{name:>7}: retained {retained / 2**20:8.1f} MiB  peak {peak / 2**20:8.1f} MiB  build {elapsed:.2f} s")
+            print(f"retained memory reduced {measured['legacy'] / max(measured['arrays'], 1):.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the cost of the session on the student polling endpoint for each SESSION_STORE backend.
+
+    python -m benchmarks.bench_session_store --students 200 --polls 20 [--stores cookie memory sqlite]
+
+Every student logs in and joins the session, then polls get_current_question. Reported per backend:
+request latency, time spent opening and saving the session, the size of the Cookie header the
+browser sends on each poll, and the store counters.
+"""
+import argparse
+import os
+import tempfile
+from app.live_state import clear_live_states
+from benchmarks.harness import Timer, create_benchmark_app, login_test_client, seed_classroom, summarize_ms
+
+
+def _time_session_interface(app, session_seconds):
+    interface = app.session_interface
+    open_session, save_session = interface.open_session, interface.save_session
+
+    def timed_open(*args):
+        with Timer() as timer:
+            result = open_session(*args)
+        session_seconds.append(timer.elapsed)
+        return result
+
+    def timed_save(*args):
+        with Timer() as timer:
+            save_session(*args)
+        session_seconds[-1] += timer.elapsed
+
+    interface.open_session, interface.save_session = timed_open, timed_save
+
+
+def run(store, tmp, num_students, num_polls):
+    app = create_benchmark_app(os.path.join(tmp, f'{store}.db'), SESSION_STORE=store,
+                               SESSION_STORE_URL=os.path.join(tmp, f'{store}-sessions.db'))
+    with app.app_context():
+        class_session_id, _, student_ids = seed_classroom(num_students)
+        clear_live_states()
+
+    clients = []
+    for student_id in student_ids:
+        client = app.test_client()
+        login_test_client(app, client, student_id, class_session_id)
+        clients.append(client)
+
+    session_seconds = []
+    _time_session_interface(app, session_seconds)
+    if hasattr(app.session_interface, 'stats'):
+        app.session_interface.stats.reset()
+
+    latencies = []
+    cookie_bytes = []
+    for _ in range(num_polls):
+        for client in clients:
+            cookie_name = app.config['SESSION_COOKIE_NAME']
+            cookie = client.get_cookie(cookie_name)
+            cookie_bytes.append(len(f'{cookie_name}={cookie.value}') if cookie else 0)
+            with Timer() as timer:
+                response = client.get('/student/get_current_question')
+            if response.status_code != 200:
+                raise RuntimeError(f"Poll failed with {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            latencies.append(timer.elapsed)
+
+    summary = summarize_ms(latencies)
+    summary['session_ms'] = summarize_ms(session_seconds)['mean_ms']
+    summary['cookie_bytes'] = sum(cookie_bytes) / len(cookie_bytes)
+    summary['stats'] = app.session_interface.stats.as_dict() if hasattr(app.session_interface, 'stats') else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stores', nargs='+', default=['cookie', 'memory', 'sqlite'])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--polls', type=int, default=20, help='Polls per student.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for store in args.stores:
+            result = run(store, tmp, args.students, args.polls)
+            print(f"{store:>6}: mean {result['mean_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms  "
+                  f"session open+save {result['session_ms']:.3f} ms  cookie {result['cookie_bytes']:.0f} bytes")
+            if result['stats']:
+                stats = result['stats']
+                print(f"        lookups {stats['lookups']} (hits {stats['hits']}, misses {stats['misses']}, "
+                      f"mean {stats['mean_lookup_ms']:.3f} ms)  writes {stats['writes']}  purged {stats['purged']}")
+
+
+if __name__ == '__main__':
+    main()
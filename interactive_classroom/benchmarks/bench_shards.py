@@ -0,0 +1,102 @@
+"""
+Measures submit throughput with the session tables split over 1, 2, 4... SQLite shard files.
+
+    python -m benchmarks.bench_shards --shards 1 2 4 --writers 8 --students 100 [--dir PATH]
+
+Each classroom session gets its own writer process (like separate app workers) that records every
+student's answer to every seed question through insert_student_response() (one INSERT + commit
+each), as concurrent student_submit_answer requests would. The --writers sessions are spread evenly
+over the shards, so with more shards fewer writers share a database write lock. Writers set up
+their app first and wait on a barrier; only the submit loops are timed. Per shard, the report shows
+the number of writers, its throughput and the submit latency, where lock waits show up. Use --dir
+on a real disk: on tmpfs commits are too cheap for the lock to matter.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import defaultdict
+from app import create_app, db
+from app.models import Question
+from app.services import insert_student_response
+from app.sharding import shard_for_class_session_id, use_shard
+from benchmarks.harness import Timer, create_benchmark_app, seed_classroom, summarize_ms
+
+
+def _submit_all(settings, class_session_id, student_ids, question_ids, ready, results):
+    app = create_app(type('BenchmarkConfig', (), settings))
+    latencies = []
+    with app.app_context(), use_shard(shard_for_class_session_id(class_session_id)):
+        try:
+            ready.wait() # Everyone starts submitting together, after start-up
+            started = time.monotonic()
+            for question_id in question_ids:
+                for student_id in student_ids:
+                    with Timer() as timer:
+                        insert_student_response(student_id, class_session_id, question_id, 0) # 'A'
+                    latencies.append(timer.elapsed)
+            finished = time.monotonic() # CLOCK_MONOTONIC is shared by all processes on the host
+        finally:
+            db.session.remove()
+    results.put((class_session_id, started, finished, latencies))
+
+
+def run(num_shards, num_writers, num_students, directory):
+    database_dir = tempfile.mkdtemp(dir=directory)
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(database_dir, 'catalog.db')}",
+        'SHARD_DATABASE_URIS': [f"sqlite:///{os.path.join(database_dir, f'shard_{i}.db')}" for i in range(num_shards)],
+    }
+    app = create_benchmark_app(settings['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):], **settings)
+    with app.app_context():
+        classrooms = [seed_classroom(num_students, shard=i % num_shards) for i in range(num_writers)]
+        question_ids = [question_id for (question_id,) in db.session.query(Question.id)]
+        db.session.remove()
+
+    context = multiprocessing.get_context('spawn')
+    ready = context.Barrier(num_writers)
+    results = context.Queue()
+    writers = [context.Process(target=_submit_all, args=(settings, class_session_id, student_ids, question_ids, ready, results))
+               for class_session_id, _, student_ids in classrooms]
+    for writer in writers:
+        writer.start()
+    finished = [results.get() for _ in writers] # Read before join so the queue does not block the writers
+    for writer in writers:
+        writer.join()
+    failed = [writer for writer in writers if writer.exitcode != 0]
+    if failed: # A locked database counts as a failed run
+        raise RuntimeError(f"{len(failed)} writer process(es) failed, see their tracebacks above.")
+
+    elapsed = max(end for _, _, end, _ in finished) - min(start for _, start, _, _ in finished)
+    per_shard = defaultdict(lambda: {'writers': 0, 'latencies': []})
+    for class_session_id, _, _, latencies in finished:
+        shard = per_shard[class_session_id % num_shards]
+        shard['writers'] += 1
+        shard['latencies'].extend(latencies)
+    return sum(len(latencies) for _, _, _, latencies in finished), elapsed, dict(sorted(per_shard.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--writers', type=int, default=8, help='Concurrent classroom sessions (one writer process each).')
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--dir', default=None, help='Directory for the database files (default: system temp dir).')
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {os.cpu_count()} CPU(s)")
+    baseline = None
+    for num_shards in args.shards:
+        submits, elapsed, per_shard = run(num_shards, args.writers, args.students, args.dir)
+        throughput = submits / elapsed
+        baseline = baseline or throughput
+        print(f"{num_shards:>3} shard(s): {submits} submits in {elapsed:.2f} s = {throughput:,.0f} submits/s ({throughput / baseline:.2f}x)")
+        for index, shard in per_shard.items():
+            latency = summarize_ms(shard['latencies'])
+            print(f"      shard {index}: {shard['writers']} writer(s)  {len(shard['latencies']) / elapsed:,.0f} submits/s  "
+                  f"submit p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Tracks cold start: process start to create_app() and to the first handled request.
+
+    python -m benchmarks.bench_startup --runs 5 [--json]
+
+Each run is a fresh interpreter started with `python -X importtime`. The slowest imports of the
+first run are listed, and optional heavy dependencies (QR/imaging, Google auth, NumPy) that were
+loaded during startup are reported; they are meant to be imported lazily at first use.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ('qrcode', 'PIL', 'google.auth', 'google_auth_oauthlib', 'numpy', 'psycopg2')
+
+CHILD_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/student/get_current_question') # Cheap route; redirects to login
+served = time.perf_counter()
+print(json.dumps({{
+    'create_app_ms': (created - start) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'heavy_modules_loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once():
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT],
+                               cwd=APP_ROOT, capture_output=True, text=True, check=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_to_first_request_ms'] = wall_ms
+    return result, completed.stderr
+
+
+def slowest_imports(importtime_output, limit):
+    """Parses `-X importtime` lines ("import time: self | cumulative | name") into the top cumulative entries."""
+    entries = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if '.' not in name: # Top-level packages only
+            entries.append((int(cumulative_us), name))
+    return sorted(entries, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest top-level imports to list.')
+    parser.add_argument('--json', action='store_true', help='Print a machine-readable summary only.')
+    args = parser.parse_args()
+
+    results = []
+    importtime_output = None
+    for _ in range(args.runs):
+        result, stderr = run_once()
+        results.append(result)
+        importtime_output = importtime_output or stderr
+
+    summary = {key: statistics.median(r[key] for r in results)
+               for key in ('create_app_ms', 'first_request_ms', 'process_to_first_request_ms')}
+    summary['heavy_modules_loaded'] = sorted({m for r in results for m in r['heavy_modules_loaded']})
+    summary['slowest_imports'] = [{'module': name, 'cumulative_ms': us / 1000}
+                                  for us, name in slowest_imports(importtime_output, args.top)]
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"Median of {args.runs} runs:")
+    print(f"  create_app():                {summary['create_app_ms']:.1f} ms")
+    print(f"  first request after startup: {summary['first_request_ms']:.1f} ms")
+    print(f"  process start to response:   {summary['process_to_first_request_ms']:.1f} ms")
+    print(f"  heavy optional modules loaded: {', '.join(summary['heavy_modules_loaded']) or 'none'}")
+    print("Slowest top-level imports (first run):")
+    for entry in summary['slowest_imports']:
+        print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the database work of student_submit_answer before and after the single-INSERT fast path.
+
+    python -m benchmarks.bench_submit --students 500
+
+The legacy path replays the queries the route used to run: ClassSession get, StudentResponse
+existence check, ORM insert, commit and a Question get for logging. The fast path uses the
+live state cache and insert_student_response(). Each submit ends the SQLAlchemy session, as a
+request would. Statements are counted separately for first submits and for duplicate retries.
+"""
+import argparse
+import os
+import tempfile
+from sqlalchemy import event
+from app import db
+from app.live_state import clear_live_states, get_live_state
+from app.models import ClassSession, Question, StudentResponse, encode_answer
+from app.services import insert_student_response
+from benchmarks.harness import Timer, create_benchmark_app, seed_classroom, summarize_ms
+
+
+def legacy_submit(student_id, class_session_id, question_db_id, chosen_answer):
+    target_session = ClassSession.query.get(class_session_id)
+    if not target_session or not target_session.is_active:
+        return False
+    if target_session.active_question_db_id != question_db_id or target_session.active_question_status != 'open':
+        return False
+    existing_response = StudentResponse.query.filter_by(
+        student_id=student_id, class_session_id=class_session_id, question_id=question_db_id).first()
+    if existing_response:
+        return False
+    db.session.add(StudentResponse(student_id=student_id, class_session_id=class_session_id,
+                                   question_id=question_db_id, chosen_answer=chosen_answer))
+    db.session.commit()
+    Question.query.get(question_db_id).question_ref_id
+    return True
+
+
+def fast_submit(student_id, class_session_id, question_db_id, chosen_answer):
+    live_state = get_live_state(class_session_id)
+    if not live_state or not live_state.is_active:
+        return False
+    if live_state.active_question_db_id != question_db_id or live_state.active_question_status != 'open':
+        return False
+    return insert_student_response(student_id, class_session_id, question_db_id, encode_answer(chosen_answer))
+
+
+def run(submit, app, num_students):
+    with app.app_context():
+        class_session_id, question_db_id, student_ids = seed_classroom(num_students)
+        clear_live_states()
+        statements = [[], []] # Per attempt
+        attempt = 0
+        listener = lambda conn, cursor, statement, *args: statements[attempt].append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        latencies = []
+        try:
+            # Every student submits once, then everyone retries to exercise duplicate detection
+            for attempt in range(2):
+                for student_id in student_ids:
+                    with Timer() as timer:
+                        submit(student_id, class_session_id, question_db_id, 'B')
+                        db.session.remove()
+                    if attempt == 0:
+                        latencies.append(timer.elapsed)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        stored = StudentResponse.query.filter_by(class_session_id=class_session_id).count()
+    summary = summarize_ms(latencies)
+    summary['statements_per_submit'] = len(statements[0]) / num_students
+    summary['statements_per_retry'] = len(statements[1]) / num_students
+    summary['stored'] = stored
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--students', type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_benchmark_app(os.path.join(tmp, 'bench.db'))
+        for name, submit in (('legacy', legacy_submit), ('fast', fast_submit)):
+            result = run(submit, app, args.students)
+            print(f"{name:>6}: mean {result['mean_ms']:.3f} ms  p50 {result['p50_ms']:.3f} ms  "
+                  f"p95 {result['p95_ms']:.3f} ms  statements/submit {result['statements_per_submit']:.2f}  "
+                  f"statements/retry {result['statements_per_retry']:.2f}  "
+                  f"stored {result['stored']}/{args.students}")
+
+
+if __name__ == '__main__':
+    main()
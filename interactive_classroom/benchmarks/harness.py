@@ -0,0 +1,97 @@
+"""
+Shared setup for the benchmark scripts in this folder.
+Run the scripts from the interactive_classroom folder, e.g. `python -m benchmarks.bench_submit`.
+"""
+import time
+import uuid
+from flask_login.utils import _create_identifier
+from app import create_app, db
+from app.models import ClassSession, Question, User, seed_questions, session_student_association
+from app.sharding import create_shard_tables, next_class_session_id, shard_count, shard_for_session_code, use_shard
+
+
+def create_benchmark_app(database_path, **config):
+    """Creates an app on a fresh SQLite file with all tables and the seed questions."""
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database_path}',
+        'TESTING': True,
+    }
+    settings.update(config)
+    app = create_app(type('BenchmarkConfig', (), settings))
+    with app.app_context():
+        db.create_all()
+        create_shard_tables()
+        seed_questions()
+    return app
+
+
+def seed_classroom(num_students, open_question=True, shard=None):
+    """
+    Creates a teacher, an active ClassSession and `num_students` joined students.
+    With sharding, `shard` places the session in that shard instead of where its random code hashes to.
+    Must be called inside an app context. Returns (class_session_id, question_db_id, student_ids).
+    """
+    teacher = User(google_id=f'bench-teacher-{uuid.uuid4()}', email=f'teacher-{uuid.uuid4()}@bench.local', name='Bench Teacher')
+    students = [User(google_id=f'bench-{uuid.uuid4()}', email=f'{uuid.uuid4()}@bench.local', name=f'Student {i}') for i in range(num_students)]
+    db.session.add(teacher)
+    db.session.add_all(students)
+    question = Question.query.order_by(Question.id).first()
+    db.session.commit()
+
+    session_code = str(uuid.uuid4())
+    while shard is not None and shard_for_session_code(session_code) != shard:
+        session_code = str(uuid.uuid4())
+    shard = shard_for_session_code(session_code) if shard_count() else None
+    with use_shard(shard):
+        class_session = ClassSession(session_code=session_code, presenter_id=teacher.id, is_active=True)
+        if shard is not None:
+            class_session.id = next_class_session_id(shard)
+        if open_question:
+            class_session.active_question_db_id = question.id
+            class_session.active_question_status = 'open'
+        db.session.add(class_session)
+        db.session.flush()
+        if students:
+            db.session.execute(session_student_association.insert(),
+                               [{'user_id': student.id, 'class_session_id': class_session.id} for student in students])
+        db.session.commit()
+        return class_session.id, question.id, [student.id for student in students]
+
+
+def login_test_client(app, client, user_id, class_session_id=None):
+    """Logs a test client in as `user_id` the way student_google_callback would, without the OAuth round trip."""
+    with app.test_request_context(environ_base=client.environ_base):
+        identifier = _create_identifier()
+    with client.session_transaction() as flask_session:
+        flask_session['_user_id'] = str(user_id)
+        flask_session['_fresh'] = True
+        flask_session['_id'] = identifier
+        if class_session_id is not None:
+            flask_session['current_class_session_id'] = class_session_id
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_ms(latencies_s):
+    values = sorted(latency * 1000 for latency in latencies_s)
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
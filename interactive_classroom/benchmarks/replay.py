@@ -0,0 +1,296 @@
+"""
+Replays a traffic recording against a fresh app and reports latency and throughput.
+
+    python -m benchmarks.replay traffic.jsonl [--speed 10] [--workers 32] [--json report.json] [--compare baseline.json]
+
+Record with TRAFFIC_RECORD_PATH=traffic.jsonl (see app/traffic.py). The replay seeds one classroom per
+recorded class session, with a teacher and one student per recorded user, on a new SQLite file.
+It then sends each recorded request at its original offset, divided by --speed (0 = as fast as
+possible). Requests of one user are sent in order; different users run concurrently on --workers
+threads. Opening, closing and ending a question or session waits for earlier requests and holds
+back later ones, so every replay sees the same question state. Students are logged in with login_test_client instead of the Google OAuth round trip, so
+the OAuth endpoints are not replayed.
+
+The report has per-endpoint latency percentiles, overall throughput, schedule lag (how late requests
+were sent) and the number of responses whose status differs from the recording. Save one with --json
+and pass it to --compare on the next version to print the differences.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from app import db
+from app.join_tokens import make_join_token
+from app.live_state import clear_live_states
+from app.models import ClassSession, Question
+from benchmarks.harness import Timer, create_benchmark_app, login_test_client, seed_classroom, summarize_ms
+
+# Requests that change what the students' requests see. Everything sent before one of these finishes
+# first, and nothing after it starts until it is done, so results do not depend on thread timing.
+BARRIER_ENDPOINTS = {'main.set_active_question', 'main.teacher_close_question', 'main.teacher_end_session'}
+
+TEACHER_ENDPOINTS = {
+    'main.teacher_start_session', 'main.set_active_question', 'main.manage_session', 'main.manage_session_changes',
+    'main.teacher_close_question', 'main.teacher_session_results', 'main.teacher_question_analytics',
+    'main.teacher_student_analytics', 'main.teacher_end_session',
+}
+
+
+def load_records(path):
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # A worker killed mid-write can leave a partial last line
+            if isinstance(record, dict) and 'ts' in record and 'ep' in record:
+                records.append(record)
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def plan_classrooms(records):
+    """Returns {class session pseudonym: {'teacher': user pseudonym or None, 'students': [user pseudonyms]}}."""
+    classrooms = OrderedDict()
+    assigned = set()
+    for record in records:
+        cs, user = record.get('cs'), record.get('u')
+        if cs is None:
+            continue
+        classroom = classrooms.setdefault(cs, {'teacher': None, 'students': []})
+        if user is None or user in assigned:
+            continue
+        if record['ep'] in TEACHER_ENDPOINTS:
+            if classroom['teacher'] is None:
+                classroom['teacher'] = user
+                assigned.add(user)
+        else:
+            classroom['students'].append(user)
+            assigned.add(user)
+    return classrooms
+
+
+class Replay:
+
+    def __init__(self, app, records):
+        self.app = app
+        self.records = records
+        self.sessions = {} # cs pseudonym -> (class_session_id, session_code, join token)
+        self.clients = {} # user pseudonym -> test client
+        self.user_locks = defaultdict(threading.Lock)
+        self.question_ids = {} # recorded question id -> seeded question id
+        self.results = [] # (endpoint, latency s, lag s, status, recorded status)
+        self.skipped = defaultdict(int)
+        self.errors = defaultdict(int) # Exceptions raised by the app, per endpoint
+        self.first_error = None
+        self._results_lock = threading.Lock()
+
+    def seed(self):
+        with self.app.app_context():
+            seeded_questions = [question_id for (question_id,) in db.session.query(Question.id).order_by(Question.id)]
+            recorded_questions = OrderedDict((record['q'], None) for record in self.records if 'q' in record)
+            for i, recorded_id in enumerate(recorded_questions):
+                self.question_ids[recorded_id] = seeded_questions[i % len(seeded_questions)]
+
+            logins = []
+            for cs, classroom in plan_classrooms(self.records).items():
+                class_session_id, _, student_ids = seed_classroom(len(classroom['students']))
+                class_session = db.session.get(ClassSession, class_session_id)
+                with self.app.test_request_context():
+                    token = make_join_token(class_session)
+                self.sessions[cs] = (class_session_id, class_session.session_code, token)
+                if classroom['teacher'] is not None:
+                    logins.append((classroom['teacher'], class_session.presenter_id, None))
+                logins.extend((user, student_id, class_session_id) for user, student_id in zip(classroom['students'], student_ids))
+            db.session.remove()
+        clear_live_states()
+
+        for user, user_id, class_session_id in logins:
+            client = self.app.test_client()
+            login_test_client(self.app, client, user_id, class_session_id)
+            self.clients[user] = client
+
+    def _send(self, client, record):
+        """Sends the request described by `record`. Returns the response, or None if it cannot be replayed."""
+        endpoint = record['ep']
+        class_session_id, session_code, token = self.sessions.get(record.get('cs'), (None, None, None))
+        question_db_id = self.question_ids.get(record.get('q'))
+
+        if endpoint == 'main.get_current_question':
+            return client.get('/student/get_current_question')
+        if endpoint == 'main.student_submit_answer':
+            return client.post('/student/submit_answer', json={'question_db_id': question_db_id, 'chosen_answer': record.get('a', 'A')})
+        if endpoint == 'main.student_dashboard':
+            return client.get('/student/dashboard')
+        if endpoint == 'main.index':
+            return client.get('/')
+        if class_session_id is None:
+            return None
+        if endpoint == 'main.student_login':
+            if record.get('join') == 'token':
+                return client.get('/student/login', query_string={'token': token})
+            return client.get('/student/login', query_string={'session_code': session_code})
+        if endpoint == 'main.manage_session':
+            return client.get(f'/teacher/session/{class_session_id}')
+        if endpoint == 'main.manage_session_changes':
+            return client.get(f'/teacher/session/{class_session_id}/changes')
+        if endpoint == 'main.teacher_session_results':
+            return client.get(f'/teacher/session/{class_session_id}/results')
+        if endpoint == 'main.set_active_question':
+            return client.post('/teacher/set_active_question', data={'class_session_id': class_session_id, 'question_db_id': question_db_id})
+        if endpoint == 'main.teacher_close_question':
+            return client.post('/teacher/close_question', data={'class_session_id': class_session_id, 'question_db_id': question_db_id})
+        if endpoint == 'main.teacher_end_session':
+            return client.post('/teacher/end_session', data={'class_session_id': class_session_id})
+        return None
+
+    def _skip(self, endpoint):
+        with self._results_lock:
+            self.skipped[endpoint] += 1
+
+    def _run_one(self, record, scheduled_at):
+        user = record.get('u')
+        client = self.clients.get(user)
+        if client is None:
+            if user is not None or record['ep'] != 'main.student_login':
+                self._skip(record['ep'])
+                return
+            client = self.app.test_client() # Joining student, not logged in yet
+        with self.user_locks[user] if user is not None else nullcontext():
+            lag = time.perf_counter() - scheduled_at
+            try:
+                with Timer() as timer:
+                    response = self._send(client, record)
+            except Exception:
+                with self._results_lock:
+                    self.errors[record['ep']] += 1
+                    self.first_error = self.first_error or traceback.format_exc()
+                return
+        if response is None:
+            self._skip(record['ep'])
+            return
+        with self._results_lock:
+            self.results.append((record['ep'], timer.elapsed, max(lag, 0.0), response.status_code, record.get('st')))
+
+    def run(self, speed, workers):
+        first_ts = self.records[0]['ts']
+        pending = []
+        with Timer() as timer, ThreadPoolExecutor(max_workers=workers) as executor:
+            start = time.perf_counter()
+            for record in self.records:
+                scheduled_at = start + ((record['ts'] - first_ts) / speed if speed else 0.0)
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if record['ep'] in BARRIER_ENDPOINTS:
+                    wait(pending)
+                    self._run_one(record, scheduled_at)
+                    pending = []
+                else:
+                    pending.append(executor.submit(self._run_one, record, scheduled_at))
+        return timer.elapsed
+
+
+def build_report(replay, elapsed, speed):
+    by_endpoint = defaultdict(list)
+    recorded_ms = defaultdict(list)
+    for record in replay.records:
+        if 'ms' in record:
+            recorded_ms[record['ep']].append(record['ms'])
+    for endpoint, latency, _, _, _ in replay.results:
+        by_endpoint[endpoint].append(latency)
+
+    endpoints = {}
+    for endpoint, latencies in sorted(by_endpoint.items()):
+        summary = summarize_ms(latencies)
+        summary['recorded_mean_ms'] = sum(recorded_ms[endpoint]) / len(recorded_ms[endpoint]) if recorded_ms[endpoint] else None
+        endpoints[endpoint] = summary
+
+    records = replay.records
+    return {
+        'requests': len(replay.results),
+        'skipped': dict(replay.skipped),
+        'speed': speed,
+        'recorded_duration_s': records[-1]['ts'] - records[0]['ts'],
+        'replay_duration_s': elapsed,
+        'throughput_rps': len(replay.results) / elapsed if elapsed else 0.0,
+        'lag': summarize_ms([lag for _, _, lag, _, _ in replay.results]),
+        'status_mismatches': sum(1 for _, _, _, status, recorded in replay.results if recorded is not None and status != recorded),
+        'server_errors': sum(1 for _, _, _, status, _ in replay.results if status >= 500) + sum(replay.errors.values()),
+        'exceptions': dict(replay.errors),
+        'overall': summarize_ms([latency for _, latency, _, _, _ in replay.results]),
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['replay_duration_s']:.2f} s "
+          f"(recorded over {report['recorded_duration_s']:.2f} s, speed {report['speed']:g}x) = {report['throughput_rps']:,.0f} req/s")
+    print(f"lag p95 {report['lag']['p95_ms']:.2f} ms  status mismatches {report['status_mismatches']}  "
+          f"server errors {report['server_errors']}  skipped {sum(report['skipped'].values())}")
+    for endpoint, count in sorted(report['exceptions'].items()):
+        print(f"  {count} exception(s) in {endpoint}")
+    print(f"{'Endpoint':<36}{'Count':>7}{'Mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'Recorded':>10}")
+    for endpoint, summary in report['endpoints'].items():
+        recorded = f"{summary['recorded_mean_ms']:.2f}" if summary['recorded_mean_ms'] is not None else '-'
+        print(f"{endpoint:<36}{summary['count']:>7}{summary['mean_ms']:>9.2f}{summary['p50_ms']:>9.2f}"
+              f"{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}{recorded:>10}")
+
+
+def _change(new, old):
+    return f"{(new - old) / old * 100:+.1f}%" if old else '-'
+
+
+def print_comparison(report, baseline):
+    print(f"\nCompared with baseline ({baseline['requests']} requests, {baseline['throughput_rps']:,.0f} req/s): "
+          f"throughput {_change(report['throughput_rps'], baseline['throughput_rps'])}, "
+          f"overall p95 {_change(report['overall']['p95_ms'], baseline['overall']['p95_ms'])}")
+    print(f"{'Endpoint':<36}{'Mean':>10}{'Change':>9}{'p95':>10}{'Change':>9}")
+    for endpoint, summary in report['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if old is None:
+            continue
+        print(f"{endpoint:<36}{summary['mean_ms']:>10.2f}{_change(summary['mean_ms'], old['mean_ms']):>9}"
+              f"{summary['p95_ms']:>10.2f}{_change(summary['p95_ms'], old['p95_ms']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('recording', help='JSON lines file written by the traffic recorder.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Time compression factor; 0 sends requests back to back.')
+    parser.add_argument('--workers', type=int, default=32, help='Threads sending requests concurrently.')
+    parser.add_argument('--json', dest='json_path', help='Write the report to this file.')
+    parser.add_argument('--compare', help='Report from an earlier run to compare against.')
+    args = parser.parse_args()
+
+    records = load_records(args.recording)
+    if not records:
+        parser.error(f"No requests found in {args.recording}.")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_benchmark_app(os.path.join(tmp, 'replay.db'))
+        replay = Replay(app, records)
+        replay.seed()
+        elapsed = replay.run(args.speed, args.workers)
+        report = build_report(replay, elapsed, args.speed)
+
+    print_report(report)
+    if replay.first_error:
+        print(f"\nFirst exception:\n{replay.first_error}")
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,8 +10,12 @@ app = create_app()
 @with_appcontext
 def create_db_command():
     """Creates the database tables."""
+    from app.sharding import create_shard_tables, shard_count
     db.create_all()
+    create_shard_tables()
     click.echo('Database tables created.')
+    if shard_count():
+        click.echo(f'Session tables created in {shard_count()} shard(s).')
 
 app.cli.add_command(create_db_command)
 
@@ -25,6 +29,63 @@ def seed_questions_command():
 
 app.cli.add_command(seed_questions_command)
 
+@click.command('archive-sessions')
+@click.option('--days', default=30, show_default=True, help='Archive ended sessions created more than this many days ago.')
+@click.option('--dry-run', is_flag=True, help='Report what would be archived without changing the database.')
+@with_appcontext
+def archive_sessions_command(days, dry_run):
+    """Moves responses of old ended sessions into the compact archive."""
+    from app.archive import archive_ended_sessions
+    report = archive_ended_sessions(days, dry_run=dry_run)
+    prefix = 'Would archive' if dry_run else 'Archived'
+    click.echo(f'{prefix} {report.sessions} session(s), {report.responses} response(s) packed into {report.packed_bytes} bytes.')
+    if report.reclaimed_bytes is not None:
+        click.echo(f'Space reclaimed in the database: {report.reclaimed_bytes} bytes.')
+    elif not dry_run:
+        click.echo('Space reclaimed could not be measured for this database backend.')
+
+app.cli.add_command(archive_sessions_command)
+
+@click.command('upgrade-answer-codes')
+@with_appcontext
+def upgrade_answer_codes_command():
+    """Converts student_response from answer letters to integer answer codes."""
+    from app.models import upgrade_answer_codes
+    upgraded = upgrade_answer_codes()
+    click.echo(f'Upgraded {upgraded} student_response table(s) to answer codes.' if upgraded else 'Answer codes already in use, nothing to upgrade.')
+
+app.cli.add_command(upgrade_answer_codes_command)
+
+@click.group('analytics')
+def analytics_group():
+    """Cross-session analytics over all responses, including archived sessions."""
+
+@analytics_group.command('questions')
+@click.option('--presenter-id', type=int, default=None, help='Only sessions presented by this user.')
+@with_appcontext
+def question_analytics_command(presenter_id):
+    """Prints difficulty and discrimination per question."""
+    from app.analytics import question_statistics
+    click.echo(f"{'Q-Ref':<12}{'DB ID':>7}{'Answers':>10}{'Correct':>10}{'Difficulty':>12}{'Discrim.':>10}")
+    for stats in question_statistics(presenter_id=presenter_id):
+        discrimination = 'n/a' if stats['discrimination'] is None else f"{stats['discrimination']:.3f}"
+        click.echo(f"{stats['question_ref_id'] or '?':<12}{stats['question_db_id']:>7}{stats['answered']:>10}"
+                   f"{stats['correct']:>10}{stats['difficulty']:>12.3f}{discrimination:>10}")
+
+@analytics_group.command('students')
+@click.option('--student-id', type=int, default=None, help='Only this student.')
+@click.option('--period', type=click.Choice(['day', 'week']), default='week', show_default=True)
+@click.option('--presenter-id', type=int, default=None, help='Only sessions presented by this user.')
+@with_appcontext
+def student_analytics_command(student_id, period, presenter_id):
+    """Prints accuracy per student over time."""
+    from app.analytics import student_accuracy_history
+    click.echo(f"{'Student':>8}  {'Period':<12}{'Answers':>9}{'Correct':>9}{'Accuracy':>10}")
+    for row in student_accuracy_history(period=period, presenter_id=presenter_id, student_id=student_id):
+        click.echo(f"{row['student_id']:>8}  {row['period_start']:<12}{row['answered']:>9}{row['correct']:>9}{row['accuracy']:>10.3f}")
+
+app.cli.add_command(analytics_group)
+
 
 if __name__ == '__main__':
     # For development, consider using Flask's built-in server with debugging.